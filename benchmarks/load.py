@@ -0,0 +1,454 @@
+"""
+Load test of every route of the trivia api.
+
+Seeds a database with --questions questions, serves signing keys from a
+local JWKS server instead of Auth0 and starts the app with gunicorn. Each
+route is then requested --requests times by --concurrency clients, and the
+throughput, latency percentiles and queries per request of every route are
+printed as JSON. Uses DATABASE_URL when set, which must be a scratch
+database as it is seeded and written to, otherwise a temporary sqlite
+database.
+
+Run from the repository root with ``python -m benchmarks.load``.
+"""
+
+import argparse
+import base64
+import http.server
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from Crypto.PublicKey import RSA
+
+from jose import jwt
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+parser.add_argument('--questions', type=int, default=1000)
+parser.add_argument('--requests', type=int, default=200)
+parser.add_argument('--concurrency', type=int, default=8)
+parser.add_argument('--workers', type=int, default=2)
+parser.add_argument('--threads', type=int, default=4)
+parser.add_argument('--import-rows', type=int, default=100)
+parser.add_argument('--routes', nargs='*',
+                    help='names of the routes to run, all by default')
+options = parser.parse_args()
+
+if not os.environ.get('DATABASE_URL'):
+    database_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+
+KEY_ID = 'benchmark'
+MANAGER_PERMISSIONS = [
+    'add-question', 'update-question', 'delete-question', 'play-quiz'
+]
+CATEGORIES = [
+    'Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports'
+]
+QUERIES_PATTERN = re.compile(r'desc="(\d+) queries"')
+SERVER_START_TIMEOUT = 30
+# All requests come from one client, limits can still be set through the
+# environment.
+RATE_LIMITS_OFF = {
+    'READ_RATE_LIMIT': '0',
+    'QUIZ_RATE_LIMIT': '0',
+    'WRITE_RATE_LIMIT': '0',
+}
+
+
+def get_free_port():
+    """
+    Return a free local tcp port.
+
+    :return:
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def encode_number(value):
+    """
+    Encode integer as unpadded base64url, as used by json web keys.
+
+    :param value:
+    :return:
+    """
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def start_jwks_server(key):
+    """
+    Serve public part of key as json web key set on a local port.
+
+    :param key: RSA private key
+    :return: url of the key set
+    """
+    body = json.dumps({'keys': [{
+        'kty': 'RSA',
+        'kid': KEY_ID,
+        'use': 'sig',
+        'n': encode_number(key.n),
+        'e': encode_number(key.e)
+    }]}).encode()
+
+    class JWKSHandler(http.server.BaseHTTPRequestHandler):
+        """Handler returning the key set for every path."""
+
+        def do_GET(self):
+            """
+            Send key set.
+
+            :return:
+            """
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'max-age=86400')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            """
+            Do not log requests.
+
+            :param args:
+            :return:
+            """
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), JWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}/.well-known/jwks.json'
+
+
+def mint_token(key, subject, permissions):
+    """
+    Return token signed by key with the claims checked by the app.
+
+    :param key: RSA private key
+    :param subject:
+    :param permissions:
+    :return:
+    """
+    from flaskr.auth import API_AUDIENCE, AUTH0_DOMAIN
+
+    now = int(time.time())
+    return jwt.encode({
+        'iss': f'https://{AUTH0_DOMAIN}/',
+        'sub': subject,
+        'aud': API_AUDIENCE,
+        'iat': now,
+        'exp': now + 24 * 60 * 60,
+        'permissions': permissions
+    }, key.export_key('PEM').decode(), algorithm='RS256',
+        headers={'kid': KEY_ID})
+
+
+def seed_database(questions, reserved):
+    """
+    Create tables and insert categories and questions.
+
+    :param questions: number of questions read by the routes
+    :param reserved: number of extra questions deleted by the benchmark
+    :return: ids of the questions which may be deleted
+    """
+    from flaskr import create_app
+    from migrations import apply_migrations
+    from models import Category, Question, db
+
+    with create_app().app_context():
+        apply_migrations()
+        if not Category.query.count():
+            db.session.execute(Category.__table__.insert(), [
+                {'id': index + 1, 'type': category}
+                for index, category in enumerate(CATEGORIES)
+            ])
+
+        db.session.execute(Question.__table__.insert(), [
+            {
+                'question': f'What is question number {index}?',
+                'answer': f'Answer {index}',
+                'category': index % len(CATEGORIES) + 1,
+                'difficulty': index % 5 + 1
+            }
+            for index in range(questions + reserved)
+        ])
+        db.session.commit()
+        reserved_ids = [
+            row.id for row in db.session.query(Question.id)
+            .order_by(Question.id.desc()).limit(reserved)
+        ]
+        db.engine.dispose()
+
+    return reserved_ids
+
+
+def start_app_server(jwks_url):
+    """
+    Start the app with gunicorn and wait until it answers.
+
+    :param jwks_url:
+    :return: gunicorn process and base url of the app
+    """
+    port = get_free_port()
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn.app.wsgiapp',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(options.workers),
+        '--threads', str(options.threads),
+        '--log-level', 'warning',
+        'wsgi:app'
+    ], env={**RATE_LIMITS_OFF, **os.environ, 'AUTH0_JWKS_URL': jwks_url})
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            urllib.request.urlopen(f'{base_url}/categories')
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError('app server did not start')
+
+
+def get_routes(manager_token, member_token, reserved_ids):
+    """
+    Return requests to send per route name.
+
+    Every route is a function of the request index returning method, path,
+    body, token and content type of the request.
+
+    :param manager_token:
+    :param member_token:
+    :param reserved_ids: ids of questions deleted by the delete route
+    :return:
+    """
+    pages = max(options.questions // 10, 1)
+    question = {
+        'question': 'Benchmark question?',
+        'answer': 'Benchmark answer',
+        'category': 1,
+        'difficulty': 1
+    }
+    import_body = ''.join(
+        json.dumps(question) + '\n' for _ in range(options.import_rows)
+    )
+
+    def previous_questions():
+        """
+        Return ids of a quiz played half way.
+
+        :return:
+        """
+        return random.sample(range(1, options.questions + 1),
+                             min(5, options.questions))
+
+    return {
+        'get_categories': lambda index: (
+            'GET', '/categories', None, None, None
+        ),
+        'get_questions': lambda index: (
+            'GET', f'/questions?page={index % pages + 1}', None, None, None
+        ),
+        'get_questions_by_cursor': lambda index: (
+            'GET', f'/questions?after_id={index % options.questions}',
+            None, None, None
+        ),
+        'get_questions_by_category': lambda index: (
+            'GET', f'/categories/{index % len(CATEGORIES) + 1}/questions',
+            None, None, None
+        ),
+        'export_questions_in_bulk': lambda index: (
+            'GET', '/questions/export', None, None, None
+        ),
+        'search_questions_by_term': lambda index: (
+            'POST', '/questions/filter',
+            {'searchTerm': f'number {index % options.questions}'},
+            None, 'application/json'
+        ),
+        'add_question': lambda index: (
+            'POST', '/questions', question, manager_token, 'application/json'
+        ),
+        'import_questions_in_bulk': lambda index: (
+            'POST', '/questions/import', import_body, manager_token,
+            'application/x-ndjson'
+        ),
+        'update_question': lambda index: (
+            'PATCH', f'/questions/{index % options.questions + 1}',
+            question, manager_token, 'application/json'
+        ),
+        'delete_question': lambda index: (
+            'DELETE', f'/questions/{reserved_ids[index]}', None,
+            manager_token, None
+        ),
+        'play_quiz': lambda index: (
+            'POST', '/quizzes', {
+                'quiz_category': {'id': index % (len(CATEGORIES) + 1)},
+                'previous_questions': previous_questions()
+            }, member_token, 'application/json'
+        ),
+        'start_quiz_session': lambda index: (
+            'POST', '/quizzes', {
+                'quiz_category': {'id': index % (len(CATEGORIES) + 1)},
+                'start_session': True
+            }, member_token, 'application/json'
+        ),
+        'metrics': lambda index: ('GET', '/metrics', None, None, None),
+    }
+
+
+def send_request(base_url, method, path, body, token, content_type):
+    """
+    Send request and return its status, latency and number of queries.
+
+    :param base_url:
+    :param method:
+    :param path:
+    :param body: dict sent as json, or text
+    :param token: bearer token, if any
+    :param content_type:
+    :return:
+    """
+    headers = {}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    if content_type:
+        headers['Content-Type'] = content_type
+    if isinstance(body, dict):
+        body = json.dumps(body)
+
+    request = urllib.request.Request(
+        base_url + path, data=body.encode() if body is not None else None,
+        headers=headers, method=method
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+            server_timing = response.headers.get('Server-Timing', '')
+    except urllib.error.HTTPError as error:
+        error.read()
+        status = error.code
+        server_timing = error.headers.get('Server-Timing', '')
+    latency = time.perf_counter() - start
+
+    match = QUERIES_PATTERN.search(server_timing)
+    return status, latency, int(match.group(1)) if match else None
+
+
+def get_percentile(latencies, percentile):
+    """
+    Return nearest rank percentile of sorted latencies in milliseconds.
+
+    :param latencies:
+    :param percentile:
+    :return:
+    """
+    index = max(int(round(percentile / 100 * len(latencies))) - 1, 0)
+    return round(latencies[index] * 1000, 3)
+
+
+def run_route(base_url, route):
+    """
+    Send --requests requests of route with --concurrency clients.
+
+    :param base_url:
+    :param route: function returning the request of given index
+    :return: stats of the route
+    """
+    def send(index):
+        """
+        Send request of given index.
+
+        :param index:
+        :return:
+        """
+        return send_request(base_url, *route(index))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(options.concurrency) as executor:
+        results = list(executor.map(send, range(options.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        'requests': len(results),
+        'errors': sum(1 for status, _, _ in results if status >= 400),
+        'statuses': statuses,
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': get_percentile(latencies, 50),
+        'p95_ms': get_percentile(latencies, 95),
+        'p99_ms': get_percentile(latencies, 99),
+        'queries_per_request': round(sum(queries) / len(queries), 2)
+        if queries else None,
+    }
+
+
+def get_commit():
+    """
+    Return commit of the working tree, if it is a git checkout.
+
+    :return:
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """
+    Run benchmark and print results as json.
+
+    :return:
+    """
+    key = RSA.generate(2048)
+    jwks_url = start_jwks_server(key)
+    manager_token = mint_token(key, 'benchmark|manager', MANAGER_PERMISSIONS)
+    member_token = mint_token(key, 'benchmark|member', ['play-quiz'])
+    reserved_ids = seed_database(options.questions, options.requests)
+
+    routes = get_routes(manager_token, member_token, reserved_ids)
+    names = options.routes or list(routes)
+    process, base_url = start_app_server(jwks_url)
+    try:
+        results = {name: run_route(base_url, routes[name]) for name in names}
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(json.dumps({
+        'commit': get_commit(),
+        'database': os.environ['DATABASE_URL'].split(':', 1)[0],
+        'questions': options.questions,
+        'requests': options.requests,
+        'concurrency': options.concurrency,
+        'workers': options.workers,
+        'threads': options.threads,
+        'routes': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark of the per row cost of listing questions.
+
+Compares building Question models, calling Question.format and encoding
+with the json module of the standard library, to selecting columns only,
+formatting rows with Question.format_row and encoding with the encoder
+configured for the app. Uses DATABASE_URL when set, otherwise a temporary
+sqlite database seeded with --rows questions.
+
+Run from the repository root with ``python -m benchmarks.serialization``.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+parser.add_argument('--rows', type=int, default=20000)
+parser.add_argument('--repeat', type=int, default=5)
+options = parser.parse_args()
+
+if not os.environ.get('DATABASE_URL'):
+    database_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    seed = True
+else:
+    seed = False
+
+from flaskr import create_app  # noqa: E402
+from flaskr.serialization import USE_ORJSON, dumps  # noqa: E402
+
+from migrations import apply_migrations  # noqa: E402
+
+from models import Question, db  # noqa: E402
+
+
+def seed_questions(rows):
+    """
+    Insert given number of questions.
+
+    :param rows:
+    :return:
+    """
+    db.session.execute(Question.__table__.insert(), [
+        {
+            'question': f'Question {index}?',
+            'answer': f'Answer {index}',
+            'category': index % 6 + 1,
+            'difficulty': index % 5 + 1
+        }
+        for index in range(rows)
+    ])
+    db.session.commit()
+
+
+def serialize_models():
+    """
+    Serialize questions through models and the standard json module.
+
+    :return:
+    """
+    questions = [question.format() for question in Question.query]
+    return json.dumps(questions, sort_keys=True, separators=(',', ':'))
+
+
+def serialize_rows():
+    """
+    Serialize questions through column rows and the app encoder.
+
+    :return:
+    """
+    rows = db.session.query(*Question.columns())
+    return dumps([Question.format_row(row) for row in rows])
+
+
+def measure(function, rows):
+    """
+    Return best time per row in microseconds over the repeats.
+
+    :param function:
+    :param rows:
+    :return:
+    """
+    timings = []
+    for _ in range(options.repeat):
+        db.session.expire_all()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+        db.session.remove()
+
+    return min(timings) / rows * 1e6
+
+
+def main():
+    """
+    Run benchmark and print results as json.
+
+    :return:
+    """
+    with create_app().app_context():
+        if seed:
+            apply_migrations()
+            seed_questions(options.rows)
+
+        rows = Question.query.count()
+        before = measure(serialize_models, rows)
+        after = measure(serialize_rows, rows)
+
+    print(json.dumps({
+        'rows': rows,
+        'encoder': 'orjson' if USE_ORJSON else 'json',
+        'before_us_per_row': round(before, 3),
+        'after_us_per_row': round(after, 3),
+        'speedup': round(before / after, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
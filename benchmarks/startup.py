@@ -0,0 +1,158 @@
+"""
+Startup benchmark of the app.
+
+Measures, each time in a fresh process, how long importing and creating
+the app served by gunicorn takes and how many SQL statements it runs, then
+how long gunicorn takes until all its --workers are ready, with and
+without --preload. Uses DATABASE_URL when set, otherwise a temporary
+sqlite database.
+
+Run from the repository root with ``python -m benchmarks.startup``.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+parser.add_argument('--workers', type=int, default=4)
+parser.add_argument('--repeat', type=int, default=5)
+options = parser.parse_args()
+
+BOOT_TIMEOUT = 30
+CREATE_APP_SCRIPT = '''
+import json
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+statements = []
+event.listen(
+    Engine, 'before_cursor_execute', lambda *args: statements.append(1)
+)
+start = time.perf_counter()
+import wsgi  # noqa: E402,F401
+print(json.dumps({
+    'seconds': time.perf_counter() - start, 'statements': len(statements)
+}))
+'''
+GUNICORN_CONFIG = '''
+import time
+
+exec(open({config!r}).read())
+
+
+def post_worker_init(worker):
+    with open({ready!r}, 'a') as ready:
+        ready.write(f'{{time.time()}}\\n')
+'''
+
+
+def measure_create_app():
+    """
+    Import and create the app in a new process.
+
+    :return: seconds and number of SQL statements run
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', CREATE_APP_SCRIPT],
+        check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output)
+    return result['seconds'], result['statements']
+
+
+def measure_boot(work_dir, preload):
+    """
+    Start gunicorn and wait until all workers are ready.
+
+    :param work_dir: directory for the config and ready files
+    :param preload: load the app in the master before forking workers
+    :return: seconds from start until last worker is ready
+    """
+    ready_path = os.path.join(work_dir, 'ready')
+    config_path = os.path.join(work_dir, 'gunicorn.conf.py')
+    with open(config_path, 'w') as config:
+        config.write(GUNICORN_CONFIG.format(
+            config=os.path.abspath('gunicorn.conf.py'), ready=ready_path
+        ))
+    if os.path.exists(ready_path):
+        os.remove(ready_path)
+
+    start = time.time()
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn.app.wsgiapp',
+            '--config', config_path,
+            '--bind', '127.0.0.1:0',
+            '--workers', str(options.workers),
+            '--log-level', 'warning',
+            *(['--preload'] if preload else []),
+            'wsgi:app'
+        ],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + BOOT_TIMEOUT
+        while time.monotonic() < deadline and process.poll() is None:
+            if os.path.exists(ready_path):
+                with open(ready_path) as ready:
+                    ready_times = [float(line) for line in ready]
+                if len(ready_times) >= options.workers:
+                    return max(ready_times) - start
+
+            time.sleep(0.01)
+
+        raise RuntimeError('gunicorn workers did not start')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    """
+    Run benchmark and print results as json.
+
+    :return:
+    """
+    work_dir = tempfile.mkdtemp()
+    if not os.environ.get('DATABASE_URL'):
+        database_path = os.path.join(work_dir, 'benchmark.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+
+        from flaskr import create_app
+        from migrations import apply_migrations
+
+        with create_app().app_context():
+            apply_migrations()
+
+    create_app_runs = [measure_create_app() for _ in range(options.repeat)]
+    boot = {
+        name: statistics.median(
+            measure_boot(work_dir, preload) for _ in range(options.repeat)
+        )
+        for name, preload in (('boot', False), ('boot_preload', True))
+    }
+
+    print(json.dumps({
+        'workers': options.workers,
+        'create_app_ms': round(
+            statistics.median(seconds for seconds, _ in create_app_runs)
+            * 1000, 1
+        ),
+        'create_app_statements': create_app_runs[0][1],
+        **{
+            f'{name}_ms': round(seconds * 1000, 1)
+            for name, seconds in boot.items()
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,118 @@
 """Module for app."""
 
-import random
+import click
 
-from flask import Flask, abort, jsonify, request
+from flask import (
+    Blueprint, Flask, Response, abort, jsonify, request, stream_with_context
+)
 
 from flask_cors import CORS
 
 from flaskr.auth import AuthError, requires_auth
+from flaskr.bulk import (
+    EXPORT_FORMATS, export_questions, import_questions, iter_rows
+)
+from flaskr.compression import init_compression
 from flaskr.constants import (
-    ERROR_MESSAGES, STATUS_BAD_REQUEST, STATUS_CREATED, STATUS_FORBIDDEN,
+    ERROR_MESSAGES, QUESTIONS_PER_PAGE, QUIZ_MAX_BATCH_SIZE,
+    SEARCH_MAX_RESULTS, STATUS_BAD_REQUEST, STATUS_CREATED, STATUS_FORBIDDEN,
     STATUS_INTERNAL_SERVER_ERROR, STATUS_METHOD_NOT_ALLOWED, STATUS_NOT_FOUND,
-    STATUS_NO_CONTENT, STATUS_UNAUTHORIZED, STATUS_UNPROCESSABLE_ENTITY
+    STATUS_NO_CONTENT, STATUS_SERVICE_UNAVAILABLE, STATUS_TOO_MANY_REQUESTS,
+    STATUS_UNAUTHORIZED, STATUS_UNPROCESSABLE_ENTITY
+)
+from flaskr.http_cache import cached, conditional, get_category_tag
+from flaskr.instrumentation import init_query_instrumentation
+from flaskr.limits import (
+    init_admission_control, init_proxy_fix, quiz_limiter, rate_limit,
+    read_limiter, write_limiter
+)
+from flaskr.metrics import init_metrics
+from flaskr.quiz import (
+    get_random_question, get_random_questions, quiz_sessions
 )
+from flaskr.replicas import init_replica_routing, read_only
+from flaskr.search import search_questions
+from flaskr.serialization import FastJSONProvider
 from flaskr.utils import (
     add_new_question, get_all_categories, get_all_questions,
     get_category_by_id, get_question_by_id, get_questions_by_page,
-    update_question_in_db
+    get_questions_count, parse_bool, update_question_in_db
 )
 
+from migrations import apply_migrations
+
 from models import Question, setup_db
 
-app = Flask(__name__)
-setup_db(app)
+api = Blueprint('api', __name__, cli_group=None)
+
+
+def create_app(config=None):
+    """
+    Create app serving the api.
+
+    Database is bound without connecting to it, connections are opened on
+    first use and tables are created by the migrate command. Nothing is
+    left open for workers forked by gunicorn --preload.
+
+    :param config: mapping of settings overriding the defaults, TESTING
+    binds the test database
+    :return:
+    """
+    app = Flask(__name__)
+    app.config.update(config or {})
+    app.json = FastJSONProvider(app)
+    setup_db(app, is_test=app.testing)
+    init_query_instrumentation(app)
+    init_metrics(app)
+    init_replica_routing(app)
+    init_proxy_fix(app)
+    init_admission_control(app)
+    init_compression(app)
+    CORS(app, resources={r"*": {"origins": "*"}})
+    app.register_blueprint(api)
+    return app
+
+
+def get_counts_arg():
+    """
+    Check if question counts are requested.
+
+    :return:
+    """
+    return request.args.get('counts', False, type=parse_bool)
+
+
+@api.cli.command('migrate')
+def migrate():
+    """
+    Create missing tables and apply pending database migrations.
+
+    :return:
+    """
+    for version in apply_migrations():
+        print(f'Applied {version}')
+
+
+@api.cli.command('import-questions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_questions_command(path):
+    """
+    Import questions from json array or .ndjson/.jsonl file at path.
+
+    :param path:
+    :return:
+    """
+    content_type = 'application/x-ndjson' \
+        if path.endswith(('.ndjson', '.jsonl')) else 'application/json'
+    with open(path, 'rb') as questions_file:
+        report = import_questions(iter_rows(questions_file, content_type))
 
-CORS(app, resources={r"*": {"origins": "*"}})
+    print(f"Imported {report['imported']}, failed {report['failed']}")
+    for error in report['errors']:
+        print(f"Row {error['row']}: {error['message']}")
 
 
-@app.after_request
+@api.after_app_request
 def after_request(response):
     """
     After request method to add headers.
@@ -45,18 +131,29 @@ def after_request(response):
     return response
 
 
-@app.route('/categories')
+@api.route('/categories')
+@rate_limit(read_limiter)
+@read_only
+@conditional
+@cached(
+    tags=lambda: ('categories', 'question_counts')
+    if get_counts_arg() else ('categories',),
+    args={'counts': (parse_bool, False)}
+)
 def get_categories():
     """
     Return the categories with id and type.
 
+    Pass counts=true to get the number of questions of every category
+    along with its type.
+
     :return: raise error in case of error otherwise
     json with categories and success status
     """
     try:
         result = {
             "success": True,
-            "categories": get_all_categories()
+            "categories": get_all_categories(with_counts=get_counts_arg())
         }
         return jsonify(result)
 
@@ -64,18 +161,29 @@ def get_categories():
         abort(exp.code)
 
 
-@app.route('/questions')
+@api.route('/questions')
+@rate_limit(read_limiter)
+@read_only
+@conditional
+@cached(
+    tags=lambda: ('questions', 'categories'),
+    args={'page': (int, 1), 'after_id': (int, None)}
+)
 def get_questions():
     """
     Get questions by given page number, raise 404 if questions not found.
 
+    Pass after_id (the next_cursor of previous response) instead of page
+    to paginate by keyset.
+
     :return: raise error in case of error otherwise
     json with questions, categories, current category,
     total questions and success status
     """
     try:
         page = request.args.get('page', 1, type=int)
-        questions = get_questions_by_page(page)
+        after_id = request.args.get('after_id', type=int)
+        questions, next_cursor = get_questions_by_page(page, after_id)
 
         if len(questions) == 0:
             abort(STATUS_NOT_FOUND)
@@ -85,14 +193,57 @@ def get_questions():
             'current_category': None,
             'categories': get_all_categories(),
             'questions': questions,
-            'total_questions': len(get_all_questions())
+            'total_questions': get_questions_count(),
+            'next_cursor': next_cursor
         })
 
     except Exception as exp:
         abort(exp.code)
 
 
-@app.route('/categories/<int:category_id>/questions')
+@api.route('/questions/export')
+@rate_limit(read_limiter)
+@read_only
+def export_questions_in_bulk():
+    """
+    Stream all questions, or questions of category, as ndjson or csv.
+
+    Raise bad request if format is unknown or not found if category
+    does not exist.
+
+    :return: raise error in case of error otherwise
+    streamed response with one question per line
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        category_id = request.args.get('category', type=int)
+        if export_format not in EXPORT_FORMATS:
+            abort(STATUS_BAD_REQUEST)
+
+        if category_id is not None \
+                and get_category_by_id(category_id) is None:
+            abort(STATUS_NOT_FOUND)
+
+        return Response(
+            stream_with_context(export_questions(export_format, category_id)),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={
+                'Content-Disposition':
+                    f'attachment; filename=questions.{export_format}'
+            }
+        )
+
+    except Exception as exp:
+        abort(exp.code)
+
+
+@api.route('/categories/<int:category_id>/questions')
+@rate_limit(read_limiter)
+@read_only
+@conditional
+@cached(tags=lambda category_id: (
+    'categories', 'category_questions', get_category_tag(category_id)
+))
 def get_questions_by_category(category_id):
     """
     Get questions by category id raise 404 if category not found.
@@ -112,38 +263,55 @@ def get_questions_by_category(category_id):
             "success": True,
             "questions": questions,
             "total_questions": len(questions),
-            "current_category": category.format(),
+            "current_category": category,
         })
 
     except Exception as exp:
         abort(exp.code)
 
 
-@app.route('/questions/filter', methods=['POST'])
-def search_questions():
+@api.route('/questions/filter', methods=['POST'])
+@rate_limit(read_limiter)
+@read_only
+def search_questions_by_term():
     """
     Return the list of questions filtered by given search.
 
+    Results are ranked and paginated by page and limit of request data,
+    raise bad request if they are not positive integers or if searchTerm
+    is not a string.
+
     :return: raise error in case of error otherwise
     json with questions, total questions and success status
     """
     try:
         request_data = request.get_json()
-        questions = get_all_questions(
-            query=request_data.get('searchTerm')
+        search_term = request_data.get('searchTerm')
+        page = request_data.get('page', 1)
+        limit = request_data.get('limit', QUESTIONS_PER_PAGE)
+        if not isinstance(page, int) or not isinstance(limit, int) \
+                or limit < 1 \
+                or not isinstance(search_term, (str, type(None))):
+            abort(STATUS_BAD_REQUEST)
+
+        questions, total_questions = search_questions(
+            search_term,
+            page=page,
+            limit=min(limit, SEARCH_MAX_RESULTS)
         )
         return jsonify({
             'success': True,
             'questions': questions,
-            'total_questions': len(questions),
+            'total_questions': total_questions,
         })
 
     except Exception as exp:
         abort(exp.code)
 
 
-@app.route('/questions', methods=['POST'])
+@api.route('/questions', methods=['POST'])
 @requires_auth('add-question')
+@rate_limit(write_limiter)
 def add_question(token):
     """
     Add question to database or raise 400 if question data is incomplete.
@@ -168,8 +336,37 @@ def add_question(token):
         abort(exp.code)
 
 
-@app.route('/questions/<int:question_id>', methods=['PATCH'])
+@api.route('/questions/import', methods=['POST'])
+@requires_auth('add-question')
+@rate_limit(write_limiter)
+def import_questions_in_bulk(token):
+    """
+    Import questions sent as json array or newline delimited json.
+
+    Body is streamed and inserted in batches, invalid rows are skipped and
+    reported with their index.
+
+    :param token:
+    :return: raise error in case of error otherwise
+    json with numbers of imported and failed rows, row errors
+    and success status
+    """
+    try:
+        report = import_questions(
+            iter_rows(request.stream, request.mimetype)
+        )
+        return jsonify({
+            'success': True,
+            **report
+        }), STATUS_CREATED
+
+    except Exception as exp:
+        abort(exp.code)
+
+
+@api.route('/questions/<int:question_id>', methods=['PATCH'])
 @requires_auth('update-question')
+@rate_limit(write_limiter)
 def update_question(token, question_id):
     """
     Update question by given question id or raise 404 if question not found.
@@ -194,8 +391,9 @@ def update_question(token, question_id):
         abort(exp.code)
 
 
-@app.route('/questions/<int:question_id>', methods=['DELETE'])
+@api.route('/questions/<int:question_id>', methods=['DELETE'])
 @requires_auth('delete-question')
+@rate_limit(write_limiter)
 def delete_question(token, question_id):
     """
     Delete question by given question id or raise 404 if question not found.
@@ -218,42 +416,102 @@ def delete_question(token, question_id):
         abort(exp.code)
 
 
-@app.route('/quizzes', methods=['POST'])
+def get_session_response(session, count=None):
+    """
+    Return response with next question of quiz session.
+
+    :param session:
+    :param count: number of next questions to return in a list, None to
+    return only the next question
+    :return:
+    """
+    if count is None:
+        return jsonify({
+            'question': quiz_sessions.next_question(session),
+            'session_id': session.id,
+            'success': True
+        })
+
+    return jsonify({
+        'questions': quiz_sessions.next_questions(session, count),
+        'session_id': session.id,
+        'success': True
+    })
+
+
+@api.route('/quizzes', methods=['POST'])
 @requires_auth('play-quiz')
+@rate_limit(quiz_limiter)
+@read_only
 def play_quiz(token):
     """
     Play quiz route to get questions for quizzes.
 
     or raise bad request if quiz category not found.
 
+    Send start_session to get a session_id, then send only the session_id
+    to get next questions without resending previous questions. Raise not
+    found if session is expired or was started with another token.
+
+    Send target_difficulty to prefer questions of that difficulty, the
+    weight of other questions halves with every level of distance.
+
+    Send count to get up to count distinct questions at once in questions
+    instead of question, raise bad request if it is not between 1 and
+    QUIZ_MAX_BATCH_SIZE.
+
     :param token: string
     :return: raise error in case of error otherwise
     json with question and success status
     """
     try:
         request_data = request.get_json()
+        count = request_data.get('count')
+        if count is not None and (
+                not isinstance(count, int) or isinstance(count, bool)
+                or not 1 <= count <= QUIZ_MAX_BATCH_SIZE):
+            abort(STATUS_BAD_REQUEST)
+
+        session_id = request_data.get('session_id')
+        if session_id:
+            session = quiz_sessions.get(session_id, token.get('sub'))
+            if session is None:
+                abort(STATUS_NOT_FOUND)
+
+            return get_session_response(session, count)
+
         previous_questions = request_data.get('previous_questions', [])
         quiz_category = request_data.get('quiz_category')
 
         if not quiz_category:
             abort(STATUS_BAD_REQUEST)
 
+        target_difficulty = request_data.get('target_difficulty')
+        if target_difficulty is not None and (
+                not isinstance(target_difficulty, int)
+                or isinstance(target_difficulty, bool)):
+            abort(STATUS_BAD_REQUEST)
+
         category_id = quiz_category.get('id', 0)
-        if category_id == 0:
-            questions = get_all_questions()
-        else:
-            questions = get_all_questions(category_id=category_id)
-
-        filtered_questions = list(
-            filter(
-                lambda question:
-                question.get('id') not in previous_questions, questions
+        if request_data.get('start_session'):
+            session = quiz_sessions.create(
+                category_id, previous_questions, token.get('sub'),
+                target_difficulty
             )
+            return get_session_response(session, count)
+
+        if count is not None:
+            return jsonify({
+                'questions': get_random_questions(
+                    category_id, previous_questions, count, target_difficulty
+                ),
+                'success': True
+            })
+
+        random_question = get_random_question(
+            category_id, previous_questions, target_difficulty
         )
 
-        random_question = random.choice(filtered_questions) \
-            if filtered_questions else None
-
         return jsonify({
             'question': random_question,
             'success': True
@@ -263,7 +521,18 @@ def play_quiz(token):
         abort(exp.code)
 
 
-@app.errorhandler(AuthError)
+def get_retry_after_headers(error):
+    """
+    Get Retry-After header of error, if it has one.
+
+    :param error:
+    :return:
+    """
+    retry_after = getattr(error, 'retry_after', None)
+    return {'Retry-After': str(retry_after)} if retry_after else {}
+
+
+@api.app_errorhandler(AuthError)
 def auth_error(error):
     """
     Error handling for our custom auth error class.
@@ -274,7 +543,7 @@ def auth_error(error):
     return jsonify(error.error), error.status_code
 
 
-@app.errorhandler(STATUS_BAD_REQUEST)
+@api.app_errorhandler(STATUS_BAD_REQUEST)
 def bad_request(error):
     """
     Error handler for bad request with status code 400.
@@ -289,7 +558,7 @@ def bad_request(error):
     }), STATUS_BAD_REQUEST
 
 
-@app.errorhandler(STATUS_UNAUTHORIZED)
+@api.app_errorhandler(STATUS_UNAUTHORIZED)
 def unauthorized(error):
     """
     Error handler for unauthorized with status code 401.
@@ -304,7 +573,7 @@ def unauthorized(error):
     }), STATUS_UNAUTHORIZED
 
 
-@app.errorhandler(STATUS_FORBIDDEN)
+@api.app_errorhandler(STATUS_FORBIDDEN)
 def forbidden(error):
     """
     Error handler for forbidden with status code 403.
@@ -319,7 +588,7 @@ def forbidden(error):
     }), STATUS_FORBIDDEN
 
 
-@app.errorhandler(STATUS_NOT_FOUND)
+@api.app_errorhandler(STATUS_NOT_FOUND)
 def not_found(error):
     """
     Error handler for not found with status code 404.
@@ -334,7 +603,7 @@ def not_found(error):
     }), STATUS_NOT_FOUND
 
 
-@app.errorhandler(STATUS_METHOD_NOT_ALLOWED)
+@api.app_errorhandler(STATUS_METHOD_NOT_ALLOWED)
 def method_not_allowed(error):
     """
     Error handler for method not allowed with status code 405.
@@ -349,7 +618,7 @@ def method_not_allowed(error):
     }), STATUS_METHOD_NOT_ALLOWED
 
 
-@app.errorhandler(STATUS_UNPROCESSABLE_ENTITY)
+@api.app_errorhandler(STATUS_UNPROCESSABLE_ENTITY)
 def unprocessable_entity(error):
     """
     Error handler for unprocessable entity with status code 422.
@@ -364,7 +633,22 @@ def unprocessable_entity(error):
     }), STATUS_UNPROCESSABLE_ENTITY
 
 
-@app.errorhandler(STATUS_INTERNAL_SERVER_ERROR)
+@api.app_errorhandler(STATUS_TOO_MANY_REQUESTS)
+def too_many_requests(error):
+    """
+    Error handler for too many requests with status code 429.
+
+    :param: error
+    :return:
+    """
+    return jsonify({
+        'success': False,
+        'error': STATUS_TOO_MANY_REQUESTS,
+        'message': ERROR_MESSAGES[STATUS_TOO_MANY_REQUESTS]
+    }), STATUS_TOO_MANY_REQUESTS, get_retry_after_headers(error)
+
+
+@api.app_errorhandler(STATUS_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """
     Error handler for internal server error with status code 500.
@@ -377,3 +661,18 @@ def internal_server_error(error):
         'error': STATUS_INTERNAL_SERVER_ERROR,
         'message': ERROR_MESSAGES[STATUS_INTERNAL_SERVER_ERROR]
     }), STATUS_INTERNAL_SERVER_ERROR
+
+
+@api.app_errorhandler(STATUS_SERVICE_UNAVAILABLE)
+def service_unavailable(error):
+    """
+    Error handler for service unavailable with status code 503.
+
+    :param: error
+    :return:
+    """
+    return jsonify({
+        'success': False,
+        'error': STATUS_SERVICE_UNAVAILABLE,
+        'message': ERROR_MESSAGES[STATUS_SERVICE_UNAVAILABLE]
+    }), STATUS_SERVICE_UNAVAILABLE, get_retry_after_headers(error)
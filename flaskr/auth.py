@@ -1,23 +1,35 @@
 """Module for auth of app."""
 
+import hashlib
 import json
+import re
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from urllib.request import urlopen
 
-from flask import request
+from flask import g, request
 
 from flaskr.constants import (
     AUTHORIZATION_MALFORMED, ERROR_MESSAGES, INAPPROPRIATE_KEY,
-    INCORRECT_CLAIMS, MISSING_AUTHORIZATION, MISSING_BEARER,
+    INCORRECT_CLAIMS, JWKS_FETCH_TIMEOUT, JWKS_MAX_TTL,
+    JWKS_MIN_REFETCH_INTERVAL, JWKS_MIN_TTL, JWKS_REFRESH_MARGIN,
+    JWKS_RETRY_INTERVAL, MISSING_AUTHORIZATION, MISSING_BEARER,
     MISSING_BEARER_TOKEN, MISSING_TOKEN, STATUS_BAD_REQUEST,
-    STATUS_UNAUTHORIZED, TOKEN_EXPIRED, UNABLE_TO_PARSE
+    STATUS_UNAUTHORIZED, TOKEN_CACHE_MAX_SIZE, TOKEN_EXPIRED, TOKEN_REVOKED,
+    UNABLE_TO_PARSE
 )
+from flaskr.metrics import register_stats, time_auth
 
 from jose import jwt
 
+from settings import AUTH0_JWKS_URL
+
 AUTH0_DOMAIN = 'kagaroatgoku.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'trivia-api'
+JWKS_URL = AUTH0_JWKS_URL or f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
 
 
 class AuthError(Exception):
@@ -34,6 +46,391 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class JWKSKeyStore:
+    """
+    Process-wide cache of the Auth0 signing keys indexed by kid.
+
+    Keys are kept for the max-age advertised by the JWKS response and are
+    refreshed in a background thread shortly before they expire. An unknown
+    kid forces a synchronous refetch, at most once per
+    ``min_refetch_interval`` seconds since the last attempt, to pick up
+    rotated keys. When a fetch fails the cached keys are served for
+    ``retry_interval`` more seconds before the next attempt.
+    """
+
+    def __init__(
+            self, url, min_ttl=JWKS_MIN_TTL, max_ttl=JWKS_MAX_TTL,
+            refresh_margin=JWKS_REFRESH_MARGIN,
+            min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL,
+            retry_interval=JWKS_RETRY_INTERVAL):
+        """
+        Init method of class.
+
+        :param url: url of the json web key set
+        :param min_ttl: lower bound in seconds for the cache lifetime
+        :param max_ttl: upper bound in seconds for the cache lifetime
+        :param refresh_margin: seconds before expiry to refresh in background
+        :param min_refetch_interval: seconds between forced refetches
+        :param retry_interval: seconds to serve stale keys after a failed
+        fetch
+        """
+        self.url = url
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.refresh_margin = refresh_margin
+        self.min_refetch_interval = min_refetch_interval
+        self.retry_interval = retry_interval
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._last_attempt = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'background_refreshes': 0,
+            'forced_refreshes': 0,
+            'errors': 0,
+        }
+
+    def get_key(self, kid):
+        """
+        Return the RSA key for given kid or None if Auth0 does not know it.
+
+        :param kid:
+        :return:
+        """
+        now = time.monotonic()
+        if not self._keys or now >= self._expires_at:
+            self._refresh(now)
+        elif now >= self._expires_at - self.refresh_margin:
+            self._refresh_in_background()
+
+        rsa_key = self._keys.get(kid)
+        if rsa_key:
+            self._stats['hits'] += 1
+            return rsa_key
+
+        self._stats['misses'] += 1
+        if self._refresh(now, forced=True):
+            return self._keys.get(kid)
+
+        return None
+
+    def stats(self):
+        """
+        Return counters of the key store.
+
+        :return: dict with hit/miss/refresh counters and cached key count
+        """
+        return {
+            **self._stats,
+            'keys': len(self._keys),
+            'expires_in': max(self._expires_at - time.monotonic(), 0),
+        }
+
+    def clear(self):
+        """
+        Drop all cached keys so that next lookup fetches them again.
+
+        :return:
+        """
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._last_fetch = 0.0
+            self._last_attempt = 0.0
+
+    def _refresh(self, now, forced=False):
+        """
+        Fetch keys synchronously, only one caller fetches at a time.
+
+        :param now: monotonic time at which caller decided to refresh
+        :param forced: True when refresh is caused by an unknown kid
+        :return: True if keys were fetched by this or a concurrent caller
+        """
+        with self._lock:
+            if self._last_fetch > now:
+                # Another thread refreshed while we were waiting on the lock.
+                return True
+
+            if self._keys and self._last_attempt > now:
+                # Another thread failed to refresh while we were waiting.
+                return False
+
+            if forced and time.monotonic() - self._last_attempt \
+                    < self.min_refetch_interval:
+                return False
+
+            try:
+                self._load()
+            except Exception:
+                self._record_failure()
+                if not self._keys:
+                    raise
+                return False
+
+            self._stats['forced_refreshes' if forced else 'refreshes'] += 1
+            return True
+
+    def _refresh_in_background(self):
+        """
+        Start a daemon thread refreshing keys before they expire.
+
+        :return:
+        """
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._last_attempt \
+                    < self.retry_interval:
+                return
+            self._refreshing = True
+
+        def refresh():
+            """
+            Refresh keys and release the background refresh flag.
+
+            :return:
+            """
+            try:
+                with self._lock:
+                    self._load()
+                self._stats['background_refreshes'] += 1
+            except Exception:
+                with self._lock:
+                    self._record_failure()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _record_failure(self):
+        """
+        Count failed fetch and keep serving cached keys until next retry.
+
+        Caller must hold the lock.
+
+        :return:
+        """
+        now = time.monotonic()
+        self._stats['errors'] += 1
+        self._last_attempt = now
+        if self._keys:
+            self._expires_at = max(self._expires_at, now + self.retry_interval)
+
+    def _load(self):
+        """
+        Fetch the key set and swap it in, caller must hold the lock.
+
+        :return:
+        """
+        jwks, cache_control = self._fetch()
+        ttl = self._get_ttl(cache_control)
+
+        keys = {}
+        for key in jwks['keys']:
+            if key.get('kty') != 'RSA' or 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use'),
+                'n': key['n'],
+                'e': key['e']
+            }
+
+        now = time.monotonic()
+        self._keys = keys
+        self._last_fetch = now
+        self._last_attempt = now
+        self._expires_at = now + ttl
+
+    def _fetch(self):
+        """
+        Download the key set from Auth0.
+
+        :return: decoded key set and Cache-Control header of the response
+        """
+        response = urlopen(self.url, timeout=JWKS_FETCH_TIMEOUT)
+        return json.loads(response.read()), \
+            response.headers.get('Cache-Control')
+
+    def _get_ttl(self, cache_control):
+        """
+        Get cache lifetime from Cache-Control header clamped to bounds.
+
+        :param cache_control:
+        :return: ttl in seconds
+        """
+        match = re.search(r'max-age=(\d+)', cache_control or '')
+        ttl = int(match.group(1)) if match else self.max_ttl
+        return min(max(ttl, self.min_ttl), self.max_ttl)
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified token payloads keyed by token digest.
+
+    A payload is served until the ``exp`` claim of its token, so repeated
+    requests with the same bearer token skip signature and claims checks.
+    Revoked tokens are remembered until they expire and are never served.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_MAX_SIZE):
+        """
+        Init method of class.
+
+        :param max_size: maximum number of cached payloads
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+        }
+
+    @staticmethod
+    def digest(token):
+        """
+        Return digest of token used as cache key.
+
+        :param token:
+        :return:
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        """
+        Return cached payload for given token or None.
+
+        :param token:
+        :return:
+        """
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return payload
+
+    def set(self, token, payload):
+        """
+        Cache verified payload until the expiry of its token.
+
+        :param token:
+        :param payload: decoded and verified token claims
+        :return:
+        """
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)) \
+                or time.time() >= expires_at:
+            return
+
+        key = self.digest(token)
+        with self._lock:
+            if key in self._revoked:
+                return
+
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._purge_expired()
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def revoke(self, token, expires_at=None):
+        """
+        Drop token from cache and reject it until it expires.
+
+        :param token:
+        :param expires_at: unix time after which token is invalid anyway
+        :return:
+        """
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if expires_at is None:
+                expires_at = entry[1] if entry else float('inf')
+            self._revoked[key] = expires_at
+            now = time.time()
+            self._revoked = {
+                revoked_key: expiry
+                for revoked_key, expiry in self._revoked.items()
+                if expiry > now
+            }
+
+    def is_revoked(self, token):
+        """
+        Check if given token was revoked.
+
+        :param token:
+        :return:
+        """
+        return self.digest(token) in self._revoked
+
+    def clear(self):
+        """
+        Drop all cached payloads.
+
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return size and hit ratio of the cache.
+
+        :return:
+        """
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            **self._stats,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'revoked': len(self._revoked),
+            'hit_ratio': self._stats['hits'] / lookups if lookups else 0.0,
+        }
+
+    def _purge_expired(self):
+        """
+        Remove expired entries, caller must hold the lock.
+
+        :return:
+        """
+        now = time.time()
+        expired = [
+            key for key, (_, expires_at) in self._entries.items()
+            if now >= expires_at
+        ]
+        for key in expired:
+            del self._entries[key]
+        self._stats['expired'] += len(expired)
+
+
+jwks_store = JWKSKeyStore(JWKS_URL)
+token_cache = TokenCache()
+register_stats('jwks', jwks_store.stats)
+register_stats('token', token_cache.stats)
+
+
 def raise_auth_error(message, error=STATUS_UNAUTHORIZED):
     """
     Raise auth error with given message.
@@ -80,24 +477,18 @@ def verify_decode_jwt(token):
     :param token:
     :return:
     """
+    if token_cache.is_revoked(token):
+        raise_auth_error(TOKEN_REVOKED)
+
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     unverified_header = jwt.get_unverified_header(token)
     if 'kid' not in unverified_header:
         raise_auth_error(AUTHORIZATION_MALFORMED)
 
-    json_url = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(json_url.read())
-    rsa_key = {}
-
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -107,6 +498,7 @@ def verify_decode_jwt(token):
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
+            token_cache.set(token, payload)
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -164,9 +556,11 @@ def requires_auth(permission=''):
             :param kwargs:
             :return:
             """
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            with time_auth():
+                token = get_token_auth_header()
+                payload = verify_decode_jwt(token)
+                check_permissions(permission, payload)
+            g.auth_subject = payload.get('sub')
             return function(payload, *args, **kwargs)
 
         return wrapper
@@ -0,0 +1,328 @@
+"""Bulk import and export module for flaskr app."""
+
+import codecs
+import csv
+import io
+import json
+
+from flaskr.constants import (
+    BULK_EXPORT_BATCH_SIZE, BULK_EXPORT_CHUNK_SIZE, BULK_IMPORT_BATCH_SIZE,
+    BULK_IMPORT_CHUNK_SIZE, BULK_IMPORT_MAX_ERRORS,
+    BULK_IMPORT_MAX_ROW_SIZE, INVALID_JSON, INVALID_QUESTION_FIELD,
+    INVALID_ROW, ROW_TOO_LARGE, UNKNOWN_CATEGORY
+)
+from flaskr.serialization import dumps
+from flaskr.utils import get_all_categories
+
+from models import Question, db, notify_change
+
+QUESTION_FIELDS = ('question', 'answer', 'category', 'difficulty')
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl')
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class InvalidRow:
+    """Row of an import which could not be decoded."""
+
+    def __init__(self, message):
+        """
+        Init method of class.
+
+        :param message:
+        """
+        self.message = message
+
+
+def iter_ndjson(stream):
+    """
+    Yield rows of a newline delimited json stream.
+
+    Lines which are not valid json are yielded as InvalidRow so that the
+    rest of the stream is still imported. Lines longer than
+    BULK_IMPORT_MAX_ROW_SIZE are skipped up to the next newline without
+    being held in memory and yielded as InvalidRow too.
+
+    :param stream: binary file like object
+    :return:
+    """
+    while True:
+        line = stream.readline(BULK_IMPORT_MAX_ROW_SIZE + 1)
+        if not line:
+            return
+
+        if len(line) > BULK_IMPORT_MAX_ROW_SIZE and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(BULK_IMPORT_MAX_ROW_SIZE + 1)
+            yield InvalidRow(ROW_TOO_LARGE.format(BULK_IMPORT_MAX_ROW_SIZE))
+            continue
+
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield InvalidRow(INVALID_JSON)
+
+
+def iter_json_array(stream, chunk_size=BULK_IMPORT_CHUNK_SIZE):
+    """
+    Yield items of a json array stream without loading the whole array.
+
+    Stops with an InvalidRow at the first syntax error, or when an item is
+    larger than BULK_IMPORT_MAX_ROW_SIZE, as the rest of the array can not
+    be decoded.
+
+    :param stream: binary file like object
+    :param chunk_size: number of bytes read at once
+    :return:
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+    finished = False
+    eof = False
+
+    while not finished:
+        if not eof:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + text.decode(chunk or b'', final=eof)
+            position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != '[':
+                    yield InvalidRow(INVALID_JSON)
+                    return
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == ']':
+                finished = True
+                break
+
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof or len(buffer) - position > BULK_IMPORT_MAX_ROW_SIZE:
+                    yield InvalidRow(INVALID_JSON)
+                    return
+                # Item may continue in the next chunk.
+                break
+
+            yield item
+
+        if eof and not finished:
+            yield InvalidRow(INVALID_JSON)
+            return
+
+
+def iter_rows(stream, content_type=None):
+    """
+    Yield rows of stream decoded according to its content type.
+
+    :param stream: binary file like object
+    :param content_type: application/x-ndjson for newline delimited json,
+    otherwise stream must contain a json array
+    :return:
+    """
+    if content_type in NDJSON_CONTENT_TYPES:
+        return iter_ndjson(stream)
+
+    return iter_json_array(stream)
+
+
+def validate_question(row, categories):
+    """
+    Return error message for given row or None if it is a valid question.
+
+    :param row:
+    :param categories: map of category id to category type
+    :return:
+    """
+    if isinstance(row, InvalidRow):
+        return row.message
+
+    if not isinstance(row, dict):
+        return INVALID_ROW
+
+    for field in ('question', 'answer'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return INVALID_QUESTION_FIELD.format(field)
+
+    difficulty = row.get('difficulty')
+    if not isinstance(difficulty, int) or isinstance(difficulty, bool):
+        return INVALID_QUESTION_FIELD.format('difficulty')
+
+    try:
+        category = int(row.get('category'))
+    except (TypeError, ValueError):
+        return INVALID_QUESTION_FIELD.format('category')
+
+    if category not in categories:
+        return UNKNOWN_CATEGORY
+
+    return None
+
+
+def insert_questions(rows):
+    """
+    Insert batch of validated questions in one transaction.
+
+    Postgres uses COPY, other databases a single executemany.
+
+    :param rows: list of dicts with question fields
+    :return:
+    """
+    session = db.session
+    if db.engine.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(row[field] for field in QUESTION_FIELDS)
+        buffer.seek(0)
+
+        cursor = session.connection().connection.cursor()
+        cursor.copy_expert(
+            f'COPY {Question.__tablename__} ({", ".join(QUESTION_FIELDS)}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+    else:
+        session.execute(Question.__table__.insert(), rows)
+
+    session.commit()
+
+
+def import_questions(rows, batch_size=BULK_IMPORT_BATCH_SIZE):
+    """
+    Validate and insert questions in batches.
+
+    Only one batch is kept in memory, every batch is committed on its own,
+    and at most BULK_IMPORT_MAX_ERRORS row errors are reported.
+
+    :param rows: iterable of decoded rows
+    :param batch_size: number of questions inserted per transaction
+    :return: report with number of imported and failed rows and errors
+    """
+    categories = get_all_categories()
+    report = {
+        'imported': 0,
+        'failed': 0,
+        'errors': []
+    }
+    batch = []
+
+    def flush():
+        """
+        Insert pending batch.
+
+        :return:
+        """
+        if batch:
+            insert_questions(batch)
+            report['imported'] += len(batch)
+            batch.clear()
+
+    try:
+        for index, row in enumerate(rows):
+            error = validate_question(row, categories)
+            if error:
+                report['failed'] += 1
+                if len(report['errors']) < BULK_IMPORT_MAX_ERRORS:
+                    report['errors'].append({'row': index, 'message': error})
+                continue
+
+            batch.append({
+                'question': row['question'],
+                'answer': row['answer'],
+                'category': int(row['category']),
+                'difficulty': row['difficulty']
+            })
+            if len(batch) >= batch_size:
+                flush()
+
+        flush()
+    finally:
+        if report['imported']:
+            notify_change(Question.__tablename__, 'import')
+
+    return report
+
+
+def format_ndjson(row):
+    """
+    Return question row as json line.
+
+    :param row: tuple with id and question fields
+    :return:
+    """
+    return dumps(Question.format_row(row)) + '\n'
+
+
+def format_csv(row):
+    """
+    Return question row as csv line.
+
+    :param row: tuple with id and question fields
+    :return:
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+
+def export_questions(export_format='ndjson', category_id=None):
+    """
+    Yield chunks of questions ordered by id in given format.
+
+    Rows are read from a server side cursor in batches of
+    BULK_EXPORT_BATCH_SIZE without building model instances, and lines are
+    sent in chunks of about BULK_EXPORT_CHUNK_SIZE characters. The first
+    chunk is sent as soon as the first row is read.
+
+    :param export_format: ndjson or csv
+    :param category_id: only export questions of this category if given
+    :return:
+    """
+    rows = db.session.query(*Question.columns()).order_by(Question.id)
+    if category_id is not None:
+        rows = rows.filter(Question.category == category_id)
+    rows = rows.execution_options(stream_results=True) \
+        .yield_per(BULK_EXPORT_BATCH_SIZE)
+
+    if export_format == 'csv':
+        format_row = format_csv
+        yield format_csv(('id', *QUESTION_FIELDS))
+    else:
+        format_row = format_ndjson
+
+    chunk = []
+    chunk_size = 0
+    first = True
+    for row in rows:
+        line = format_row(row)
+        chunk.append(line)
+        chunk_size += len(line)
+        if first or chunk_size >= BULK_EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_size = 0
+            first = False
+
+    if chunk:
+        yield ''.join(chunk)
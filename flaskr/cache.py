@@ -0,0 +1,75 @@
+"""Cache module for flaskr app."""
+
+import threading
+import time
+
+
+class CachedValue:
+    """
+    Value loaded lazily and kept in memory of the worker.
+
+    Value is loaded again after ``ttl`` seconds, once it is invalidated or
+    when ``key`` returns another value than when it was loaded, every
+    invalidation bumps ``version``.
+    """
+
+    def __init__(self, loader, ttl=None, key=None):
+        """
+        Init method of class.
+
+        :param loader: callable returning the value to cache
+        :param ttl: seconds to keep the value, None to keep it until
+        invalidated
+        :param key: callable returning version of the source of the value,
+        None if only ttl and invalidation apply
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.key = key
+        self.version = 0
+        self._value = None
+        self._key = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return cached value, load it if missing or expired.
+
+        :return:
+        """
+        key = self.key() if self.key else None
+        with self._lock:
+            if not self._is_fresh() or key != self._key:
+                version = self.version
+                value = self.loader()
+                # Do not keep a value which was invalidated while loading.
+                if version == self.version:
+                    self._value = value
+                    self._key = key
+                    self._loaded_at = time.monotonic()
+                return value
+
+            return self._value
+
+    def invalidate(self):
+        """
+        Drop cached value so that next call loads it again.
+
+        :return:
+        """
+        self.version += 1
+        self._loaded_at = None
+        self._value = None
+
+    def _is_fresh(self):
+        """
+        Check if cached value can be served.
+
+        :return:
+        """
+        if self._loaded_at is None:
+            return False
+
+        return self.ttl is None \
+            or time.monotonic() - self._loaded_at < self.ttl
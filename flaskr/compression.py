@@ -0,0 +1,109 @@
+"""Response compression module for flaskr app."""
+
+import gzip
+from io import BytesIO
+
+from flask import request
+
+from flaskr.constants import STATUS_OK
+
+from settings import BROTLI_LEVEL, COMPRESSION_MIN_SIZE, GZIP_LEVEL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'
+)
+
+
+def get_encoding(size, mimetype):
+    """
+    Return encoding accepted by client to compress given body, if any.
+
+    Brotli is preferred over gzip when client accepts both equally.
+
+    :param size: length of body in bytes
+    :param mimetype:
+    :return: br, gzip or None when body should not be compressed
+    """
+    if size < COMPRESSION_MIN_SIZE or mimetype not in COMPRESSIBLE_MIMETYPES:
+        return None
+
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress(body, encoding):
+    """
+    Compress body with given encoding at the configured level.
+
+    :param body: bytes
+    :param encoding: br or gzip
+    :return:
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_LEVEL)
+
+    # gzip.compress only takes mtime from python 3.8, a fixed mtime keeps
+    # the compressed body identical across workers and requests.
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=GZIP_LEVEL,
+                       mtime=0) as gzip_file:
+        gzip_file.write(body)
+    return buffer.getvalue()
+
+
+def set_encoding(response, encoding):
+    """
+    Mark body of response as compressed with given encoding.
+
+    :param response:
+    :param encoding:
+    :return:
+    """
+    response.headers['Content-Encoding'] = encoding
+
+
+def compress_response(response):
+    """
+    Compress body of response if client accepts it.
+
+    Responses already compressed, like cached ones, and streamed responses
+    are not compressed again. ETag of the uncompressed body is made weak on
+    compressed responses as the bytes differ, weak comparison of
+    conditional requests still matches it.
+
+    :param response:
+    :return: response with compressed body
+    """
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if response.status_code == STATUS_OK and not response.is_streamed \
+            and not response.direct_passthrough \
+            and 'Content-Encoding' not in response.headers:
+        body = response.get_data()
+        encoding = get_encoding(len(body), response.mimetype)
+        if encoding is not None:
+            response.set_data(compress(body, encoding))
+            set_encoding(response, encoding)
+
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak and 'Content-Encoding' in response.headers:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def init_compression(app):
+    """
+    Compress responses of app.
+
+    :param app:
+    :return:
+    """
+    app.after_request(compress_response)
@@ -3,28 +3,36 @@
 STATUS_OK = 200
 STATUS_CREATED = 201
 STATUS_NO_CONTENT = 204
+STATUS_NOT_MODIFIED = 304
 STATUS_BAD_REQUEST = 400
 STATUS_UNAUTHORIZED = 401
 STATUS_FORBIDDEN = 403
 STATUS_NOT_FOUND = 404
 STATUS_METHOD_NOT_ALLOWED = 405
 STATUS_UNPROCESSABLE_ENTITY = 422
+STATUS_TOO_MANY_REQUESTS = 429
 STATUS_INTERNAL_SERVER_ERROR = 500
+STATUS_SERVICE_UNAVAILABLE = 503
 
 ERROR_MESSAGES = {
     STATUS_OK: 'Ok',
     STATUS_CREATED: 'Created',
     STATUS_NO_CONTENT: 'No Content',
+    STATUS_NOT_MODIFIED: 'Not Modified',
     STATUS_BAD_REQUEST: 'Bad Request',
     STATUS_UNAUTHORIZED: 'Unauthorized',
     STATUS_FORBIDDEN: 'Forbidden',
     STATUS_NOT_FOUND: 'Not Found',
     STATUS_METHOD_NOT_ALLOWED: 'Method Not Allowed',
     STATUS_UNPROCESSABLE_ENTITY: 'Unprocessable Entity',
+    STATUS_TOO_MANY_REQUESTS: 'Too Many Requests',
     STATUS_INTERNAL_SERVER_ERROR: 'Internal Server Error',
+    STATUS_SERVICE_UNAVAILABLE: 'Service Unavailable',
 }
 
 QUESTIONS_PER_PAGE = 10
+SEARCH_MAX_RESULTS = 100
+QUIZ_MAX_BATCH_SIZE = 50
 
 MISSING_AUTHORIZATION = 'Authorization header in request headers is mandatory.'
 MISSING_BEARER = 'Authorization header must start with "Bearer".'
@@ -35,3 +43,32 @@ TOKEN_EXPIRED = 'Token Expired.'
 INCORRECT_CLAIMS = 'Incorrect claims. Please, check the audience and issuer.'
 UNABLE_TO_PARSE = 'Unable to parse authentication token.'
 INAPPROPRIATE_KEY = 'Unable to find the appropriate key.'
+TOKEN_REVOKED = 'Token Revoked.'
+INVALID_JSON = 'Invalid JSON.'
+INVALID_ROW = 'Row must be a JSON object.'
+ROW_TOO_LARGE = 'Row is larger than {} bytes.'
+INVALID_QUESTION_FIELD = 'Field {} is missing or invalid.'
+UNKNOWN_CATEGORY = 'Category does not exist.'
+
+JWKS_MIN_TTL = 60
+JWKS_MAX_TTL = 24 * 60 * 60
+JWKS_REFRESH_MARGIN = 30
+JWKS_MIN_REFETCH_INTERVAL = 60
+JWKS_RETRY_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 5
+
+TOKEN_CACHE_MAX_SIZE = 10000
+
+RATE_LIMITER_MAX_KEYS = 100000
+
+BULK_IMPORT_BATCH_SIZE = 5000
+BULK_IMPORT_CHUNK_SIZE = 64 * 1024
+BULK_IMPORT_MAX_ERRORS = 1000
+BULK_IMPORT_MAX_ROW_SIZE = 1024 * 1024
+BULK_EXPORT_BATCH_SIZE = 1000
+BULK_EXPORT_CHUNK_SIZE = 64 * 1024
+SLOWEST_QUERY_MAX_LENGTH = 500
+METRICS_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+REPLICA_STICKY_COOKIE = 'read_primary_until'
@@ -0,0 +1,404 @@
+"""HTTP cache module for flaskr app."""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, request
+
+from flaskr.compression import compress, get_encoding, set_encoding
+from flaskr.constants import STATUS_NOT_MODIFIED, STATUS_OK
+from flaskr.metrics import register_stats
+from flaskr.replicas import reads_from_primary
+
+from models import Category, Question, get_data_version, on_change
+
+from settings import ETAG_TTL, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL
+
+
+def get_validators():
+    """
+    Return etag and last modified date of current request.
+
+    Both derive from the data version shared by all workers and the
+    ETAG_TTL time window, so they change on every write made through any
+    worker and at least every ETAG_TTL seconds, which bounds how long
+    writes made outside of the app go unnoticed.
+
+    :return:
+    """
+    version, updated_at = get_data_version()
+    window = int(time.time() // ETAG_TTL) * ETAG_TTL if ETAG_TTL else 0
+    key = f'{version}:{window}:{request.full_path}'
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    last_modified = max(
+        updated_at, datetime.fromtimestamp(window, timezone.utc)
+    )
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Check conditional headers of current request against validators.
+
+    :param etag:
+    :param last_modified:
+    :return:
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def conditional(function):
+    """
+    Add ETag and Last-Modified to responses of decorated GET route.
+
+    Requests with matching If-None-Match or If-Modified-Since get 304
+    before the route runs any query other than reading the data version.
+    Clients reading from primary after a write always get the full
+    response.
+
+    :param function:
+    :return:
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        """
+        Decorate wrapper method.
+
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        etag, last_modified = get_validators()
+        if not reads_from_primary() and is_not_modified(etag, last_modified):
+            response = Response(status=STATUS_NOT_MODIFIED)
+        else:
+            response = function(*args, **kwargs)
+            if not isinstance(response, Response) \
+                    or response.status_code != STATUS_OK:
+                return response
+
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
+
+
+class ResponseCache:
+    """
+    Cache of encoded response bodies with LRU and TTL eviction.
+
+    Every entry has tags naming the data it was built from, writes
+    invalidate only the entries with their tags. Compressed variants of a
+    body are kept with it so that it is compressed once. Size of all
+    bodies is bounded by ``max_bytes``.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        """
+        Init method of class.
+
+        :param ttl: seconds to keep a response
+        :param max_bytes: memory budget of all cached bodies
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return cached body and mimetype for given key or None.
+
+        :param key: tuple starting with endpoint name
+        :return:
+        """
+        with self._lock:
+            stats = self._stats.setdefault(key[0], {'hits': 0, 'misses': 0})
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry['expires_at']:
+                if entry is not None:
+                    self._discard(key)
+                stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            stats['hits'] += 1
+            return entry['body'], entry['mimetype']
+
+    def set(self, key, body, mimetype, tags):
+        """
+        Cache body of response and evict least recently used entries.
+
+        :param key: tuple starting with endpoint name
+        :param body: encoded response body
+        :param mimetype:
+        :param tags: names of data the response was built from
+        :return:
+        """
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = {
+                'body': body,
+                'mimetype': mimetype,
+                'variants': {},
+                'tags': tags,
+                'expires_at': time.monotonic() + self.ttl,
+            }
+            self.size += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def get_variant(self, key, encoding, encode):
+        """
+        Return body of entry encoded with given encoding.
+
+        Body is encoded on first call, outside of the lock, and the result
+        is kept with the entry.
+
+        :param key:
+        :param encoding:
+        :param encode: function of body and encoding returning encoded body
+        :return: encoded body or None if entry is missing
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            variant = entry['variants'].get(encoding)
+            if variant is not None:
+                return variant
+
+        variant = encode(entry['body'], encoding)
+        with self._lock:
+            if self._entries.get(key) is entry \
+                    and encoding not in entry['variants']:
+                entry['variants'][encoding] = variant
+                self.size += len(variant)
+                while self.size > self.max_bytes:
+                    self._discard(next(iter(self._entries)))
+
+        return variant
+
+    def invalidate(self, *tags):
+        """
+        Drop entries having any of given tags.
+
+        :param tags:
+        :return:
+        """
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._discard(key)
+
+    def clear(self):
+        """
+        Drop all entries.
+
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Return hits, misses and hit ratio per endpoint.
+
+        :return:
+        """
+        with self._lock:
+            routes = {}
+            for endpoint, stats in self._stats.items():
+                lookups = stats['hits'] + stats['misses']
+                routes[endpoint] = {
+                    **stats,
+                    'hit_ratio': stats['hits'] / lookups if lookups else 0.0,
+                }
+
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+                'routes': routes,
+            }
+
+    def _discard(self, key):
+        """
+        Remove entry, caller must hold the lock.
+
+        :param key:
+        :return:
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        self.size -= len(entry['body']) + sum(
+            len(variant) for variant in entry['variants'].values()
+        )
+        for tag in entry['tags']:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+response_cache = ResponseCache()
+
+
+def get_response_cache_stats():
+    """
+    Return size of the response cache with hits and misses of all routes.
+
+    :return:
+    """
+    stats = response_cache.stats()
+    routes = stats.pop('routes').values()
+    stats['hits'] = sum(route['hits'] for route in routes)
+    stats['misses'] = sum(route['misses'] for route in routes)
+    return stats
+
+
+register_stats('response', get_response_cache_stats)
+
+
+def get_category_tag(category_id):
+    """
+    Return tag of responses listing questions of category.
+
+    :param category_id:
+    :return:
+    """
+    try:
+        return f'category:{int(category_id)}'
+    except (TypeError, ValueError):
+        return f'category:{category_id}'
+
+
+@on_change
+def invalidate_responses(table, action, instance, changes):
+    """
+    Invalidate cached responses built from written data.
+
+    :param table:
+    :param action:
+    :param instance:
+    :param changes:
+    :return:
+    """
+    if table == Category.__tablename__:
+        response_cache.invalidate('categories')
+    elif table == Question.__tablename__:
+        if action == 'import':
+            response_cache.invalidate(
+                'questions', 'category_questions', 'question_counts'
+            )
+            return
+
+        tags = ['questions', get_category_tag(instance.category)]
+        if 'category' in changes:
+            tags.append(get_category_tag(changes['category']))
+        if action != 'update' or 'category' in changes:
+            tags.append('question_counts')
+        response_cache.invalidate(*tags)
+
+
+def cached(tags, args=None):
+    """
+    Cache body of successful responses of decorated GET route.
+
+    Key is made of endpoint, view arguments and the declared query
+    arguments parsed with their types, so equivalent urls share an entry
+    and unknown arguments can not bypass the cache. Key also holds the
+    shared data version, so writes made through other workers are never
+    served from this cache with a fresh ETag. Clients reading from
+    primary after a write skip cached responses. Bodies are sent
+    compressed with the variant stored in the cache.
+
+    :param tags: function returning tags of the response from view arguments
+    :param args: map of query argument name to type and default value
+    :return:
+    """
+    args = args or {}
+
+    def cached_decorator(function):
+        """
+        Cache decorator.
+
+        :param function:
+        :return:
+        """
+
+        @wraps(function)
+        def wrapper(*view_args, **view_kwargs):
+            """
+            Decorate wrapper method.
+
+            :param view_args:
+            :param view_kwargs:
+            :return:
+            """
+            key = (
+                request.endpoint,
+                tuple(sorted(view_kwargs.items())),
+                tuple(
+                    request.args.get(name, default, type=arg_type)
+                    for name, (arg_type, default) in sorted(args.items())
+                ),
+                get_data_version()[0],
+            )
+            # Clients which wrote recently must not get a response built
+            # from a lagging replica.
+            entry = None if reads_from_primary() else response_cache.get(key)
+            if entry is not None:
+                body, mimetype = entry
+                response = Response(body, mimetype=mimetype)
+            else:
+                response = function(*view_args, **view_kwargs)
+                if not isinstance(response, Response) \
+                        or response.status_code != STATUS_OK \
+                        or response.is_streamed:
+                    return response
+
+                body, mimetype = response.get_data(), response.mimetype
+                response_cache.set(key, body, mimetype, tags(**view_kwargs))
+
+            encoding = get_encoding(len(body), mimetype)
+            if encoding is not None:
+                response.set_data(
+                    response_cache.get_variant(key, encoding, compress)
+                    or compress(body, encoding)
+                )
+                set_encoding(response, encoding)
+            return response
+
+        return wrapper
+
+    return cached_decorator
@@ -0,0 +1,152 @@
+"""Instrumentation module for flaskr app."""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+
+from flaskr.constants import SLOWEST_QUERY_MAX_LENGTH
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('flaskr.sql')
+
+query_counters = []
+query_counters_lock = threading.Lock()
+
+
+class QueryStats:
+    """Number, total time and slowest of the queries of a request."""
+
+    def __init__(self):
+        """
+        Init method of class.
+
+        :return:
+        """
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_statement = None
+
+    def add(self, statement, duration):
+        """
+        Record executed query.
+
+        :param statement:
+        :param duration: seconds spent executing the query
+        :return:
+        """
+        self.count += 1
+        self.duration += duration
+        if duration > self.slowest_duration:
+            self.slowest_duration = duration
+            self.slowest_statement = statement
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context,
+                      executemany):
+    """
+    Record start time of query on the connection.
+
+    :param conn:
+    :param cursor:
+    :param statement:
+    :param parameters:
+    :param context:
+    :param executemany:
+    :return:
+    """
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context,
+                     executemany):
+    """
+    Add executed query to stats of current request and active counters.
+
+    :param conn:
+    :param cursor:
+    :param statement:
+    :param parameters:
+    :param context:
+    :param executemany:
+    :return:
+    """
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    if has_app_context():
+        if 'query_stats' not in g:
+            g.query_stats = QueryStats()
+        g.query_stats.add(statement, duration)
+
+    for counter in query_counters:
+        counter.add(statement, duration)
+
+
+def get_query_stats():
+    """
+    Return query stats of current request.
+
+    :return:
+    """
+    return g.get('query_stats') or QueryStats()
+
+
+def add_query_stats(response):
+    """
+    Add Server-Timing header and log query stats of current request.
+
+    :param response:
+    :return: response with Server-Timing header
+    """
+    stats = get_query_stats()
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'
+    )
+    logger.info('queries of %s', request.endpoint, extra={
+        'route': request.endpoint,
+        'method': request.method,
+        'status': response.status_code,
+        'query_count': stats.count,
+        'db_time_ms': round(stats.duration * 1000, 3),
+        'slowest_query_ms': round(stats.slowest_duration * 1000, 3),
+        'slowest_query': (stats.slowest_statement or '')[
+            :SLOWEST_QUERY_MAX_LENGTH
+        ],
+    })
+    return response
+
+
+def init_query_instrumentation(app):
+    """
+    Report query stats of every request of app.
+
+    :param app:
+    :return:
+    """
+    app.after_request(add_query_stats)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count queries executed by any request while in context.
+
+    Used by tests to check that a route stays within its query budget.
+
+    :return: QueryStats updated with every query of the block
+    """
+    stats = QueryStats()
+    with query_counters_lock:
+        query_counters.append(stats)
+    try:
+        yield stats
+    finally:
+        with query_counters_lock:
+            query_counters.remove(stats)
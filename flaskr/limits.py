@@ -0,0 +1,261 @@
+"""Rate limiting and admission control module for flaskr app."""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import abort, g, request
+
+from flaskr.constants import (
+    RATE_LIMITER_MAX_KEYS, STATUS_SERVICE_UNAVAILABLE,
+    STATUS_TOO_MANY_REQUESTS
+)
+
+from settings import (
+    MAX_IN_FLIGHT_REQUESTS, MAX_REQUEST_QUEUE_TIME, OVERLOAD_RETRY_AFTER,
+    QUIZ_RATE_BURST, QUIZ_RATE_LIMIT, READ_RATE_BURST, READ_RATE_LIMIT,
+    TRUSTED_PROXY_COUNT, WRITE_RATE_BURST, WRITE_RATE_LIMIT
+)
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+UNLIMITED_ENDPOINTS = ('metrics',)
+
+
+class RateLimiter:
+    """
+    Token buckets of the worker keyed by client.
+
+    Every bucket holds up to ``burst`` tokens and is refilled with ``rate``
+    tokens per second. Least recently used buckets are dropped past
+    ``max_keys``.
+    """
+
+    def __init__(self, rate, burst, max_keys=RATE_LIMITER_MAX_KEYS):
+        """
+        Init method of class.
+
+        :param rate: requests per second allowed per client, 0 for no limit
+        :param burst: requests allowed at once per client
+        :param max_keys: number of clients to remember
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Take a token from bucket of given client.
+
+        :param key:
+        :return: 0 if token was taken, otherwise seconds until next token
+        """
+        if not self.rate:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def clear(self):
+        """
+        Forget every client.
+
+        :return:
+        """
+        with self._lock:
+            self._buckets.clear()
+
+
+class ConcurrencyLimiter:
+    """Counter of requests handled at once by the worker with a maximum."""
+
+    def __init__(self, max_in_flight):
+        """
+        Init method of class.
+
+        :param max_in_flight: requests handled at once, 0 for no limit
+        """
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Admit a request unless the maximum is reached.
+
+        :return: True if request was admitted
+        """
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                return False
+
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """
+        Mark admitted request as done.
+
+        :return:
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+
+read_limiter = RateLimiter(READ_RATE_LIMIT, READ_RATE_BURST)
+quiz_limiter = RateLimiter(QUIZ_RATE_LIMIT, QUIZ_RATE_BURST)
+write_limiter = RateLimiter(WRITE_RATE_LIMIT, WRITE_RATE_BURST)
+concurrency_limiter = ConcurrencyLimiter(MAX_IN_FLIGHT_REQUESTS)
+
+
+def get_client_key():
+    """
+    Return key of client of current request.
+
+    Subject of the verified token when route requires auth, otherwise
+    address of the client.
+
+    :return:
+    """
+    subject = g.get('auth_subject')
+    if subject:
+        return f'sub:{subject}'
+
+    return f'ip:{request.remote_addr}'
+
+
+def rate_limit(limiter):
+    """
+    Reject requests of clients over the limit with 429 and Retry-After.
+
+    Must be placed below requires_auth so that clients with a token are
+    limited by subject.
+
+    :param limiter: RateLimiter of the route
+    :return:
+    """
+
+    def rate_limit_decorator(function):
+        """
+        Rate limit decorator.
+
+        :param function:
+        :return:
+        """
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            """
+            Decorate wrapper method.
+
+            :param args:
+            :param kwargs:
+            :return:
+            """
+            wait = limiter.acquire(get_client_key())
+            if wait:
+                abort(STATUS_TOO_MANY_REQUESTS, retry_after=math.ceil(wait))
+
+            return function(*args, **kwargs)
+
+        return wrapper
+
+    return rate_limit_decorator
+
+
+def get_queue_time():
+    """
+    Return seconds current request waited before reaching the app.
+
+    Read from X-Request-Start header set by the router or proxy, in
+    milliseconds or seconds since epoch, optionally prefixed with t=.
+
+    :return: seconds or None if header is missing
+    """
+    header = request.headers.get('X-Request-Start', '')
+    try:
+        started_at = float(header.replace('t=', ''))
+    except ValueError:
+        return None
+
+    if started_at > 1e11:
+        started_at /= 1000
+    return time.time() - started_at
+
+
+def admit_request():
+    """
+    Reject request with 503 when worker is overloaded.
+
+    Worker is overloaded when it already handles MAX_IN_FLIGHT_REQUESTS
+    requests, or when the request waited more than MAX_REQUEST_QUEUE_TIME
+    seconds in the queue as its client has likely given up.
+
+    :return:
+    """
+    if request.endpoint in UNLIMITED_ENDPOINTS:
+        return
+
+    queue_time = get_queue_time()
+    if MAX_REQUEST_QUEUE_TIME and queue_time is not None \
+            and queue_time > MAX_REQUEST_QUEUE_TIME:
+        abort(STATUS_SERVICE_UNAVAILABLE, retry_after=OVERLOAD_RETRY_AFTER)
+
+    if not concurrency_limiter.acquire():
+        abort(STATUS_SERVICE_UNAVAILABLE, retry_after=OVERLOAD_RETRY_AFTER)
+    g.admitted = True
+
+
+def release_request(error=None):
+    """
+    Release admitted request.
+
+    :param error:
+    :return:
+    """
+    if g.pop('admitted', False):
+        concurrency_limiter.release()
+
+
+def init_proxy_fix(app):
+    """
+    Trust forwarded headers set by the proxies in front of app.
+
+    With TRUSTED_PROXY_COUNT proxies, the client address and scheme are
+    read from X-Forwarded-For and X-Forwarded-Proto as set by the last of
+    them, so that anonymous clients behind a router are told apart.
+
+    :param app:
+    :return:
+    """
+    count = app.config.setdefault('TRUSTED_PROXY_COUNT', TRUSTED_PROXY_COUNT)
+    if count:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count, x_proto=count)
+
+
+def init_admission_control(app):
+    """
+    Shed load of app when workers are overloaded.
+
+    :param app:
+    :return:
+    """
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
@@ -0,0 +1,241 @@
+"""Prometheus metrics module for flaskr app."""
+
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+from flaskr.constants import METRICS_LATENCY_BUCKETS
+from flaskr.instrumentation import get_query_stats
+
+from models import get_pool_stats
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+
+from settings import METRICS_MULTIPROC_DIR
+
+REQUESTS = Counter(
+    'flaskr_requests_total',
+    'Number of handled requests.',
+    ['route', 'method', 'status']
+)
+REQUEST_DURATION = Histogram(
+    'flaskr_request_duration_seconds',
+    'Time spent handling requests.',
+    ['route', 'method'],
+    buckets=METRICS_LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'flaskr_requests_in_flight',
+    'Number of requests being handled.',
+    ['route'],
+    multiprocess_mode='livesum'
+)
+AUTH_DURATION = Histogram(
+    'flaskr_auth_verification_seconds',
+    'Time spent verifying bearer tokens.',
+    ['result'],
+    buckets=METRICS_LATENCY_BUCKETS
+)
+DB_DURATION = Histogram(
+    'flaskr_db_duration_seconds',
+    'Time spent executing queries per request.',
+    ['route'],
+    buckets=METRICS_LATENCY_BUCKETS
+)
+DB_QUERIES = Counter(
+    'flaskr_db_queries_total',
+    'Number of executed queries.',
+    ['route']
+)
+DB_POOL = Gauge(
+    'flaskr_db_pool',
+    'Connection pool usage of the primary database.',
+    ['stat'],
+    multiprocess_mode='livesum'
+)
+DB_POOL_MAX_WAIT = Gauge(
+    'flaskr_db_pool_max_wait_seconds',
+    'Longest wait for a connection of the primary database.',
+    multiprocess_mode='max'
+)
+CACHE_STATS = Gauge(
+    'flaskr_cache',
+    'Counters and size of the in-memory caches of the worker.',
+    ['cache', 'stat'],
+    multiprocess_mode='liveall'
+)
+
+stats_sources = {}
+
+
+def get_route():
+    """
+    Return route label of current request.
+
+    Endpoint name is used instead of the path so that ids in urls do not
+    create a time series each. Blueprint prefix is left out.
+
+    :return:
+    """
+    if request.endpoint is None:
+        return 'unmatched'
+
+    return request.endpoint.rpartition('.')[2]
+
+
+def register_stats(cache, get_stats):
+    """
+    Export stats of a cache of the worker on /metrics.
+
+    :param cache: name of the cache, used as label
+    :param get_stats: function returning map of stat name to value,
+    ratios and values which are not numbers are left out
+    :return:
+    """
+    stats_sources[cache] = get_stats
+
+
+def observe_stats():
+    """
+    Record stats of the registered caches of the worker.
+
+    :return:
+    """
+    for cache, get_stats in stats_sources.items():
+        for stat, value in get_stats().items():
+            if isinstance(value, (int, float)) \
+                    and not isinstance(value, bool) \
+                    and not stat.endswith('ratio'):
+                CACHE_STATS.labels(cache, stat).set(value)
+
+
+def start_request_timer():
+    """
+    Record start of request and count it as in flight.
+
+    :return:
+    """
+    g.metrics_route = get_route()
+    g.metrics_start_time = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+
+def observe_request(response):
+    """
+    Record status, latency and database time of current request.
+
+    :param response:
+    :return: response unchanged
+    """
+    start_time = g.pop('metrics_start_time', None)
+    if start_time is None:
+        return response
+
+    route = g.metrics_route
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    REQUEST_DURATION.labels(route, request.method).observe(
+        time.perf_counter() - start_time
+    )
+    stats = get_query_stats()
+    DB_DURATION.labels(route).observe(stats.duration)
+    if stats.count:
+        DB_QUERIES.labels(route).inc(stats.count)
+    observe_pool()
+    observe_stats()
+    return response
+
+
+def observe_pool():
+    """
+    Record usage of the connection pool of the worker.
+
+    Sqlite does not use a queue pool, nothing is recorded for it.
+
+    :return:
+    """
+    stats = get_pool_stats()
+    stats.pop('pool')
+    max_wait_time = stats.pop('max_wait_time', None)
+    if max_wait_time is not None:
+        DB_POOL_MAX_WAIT.set(max_wait_time)
+    for stat, value in stats.items():
+        DB_POOL.labels(stat).set(value)
+
+
+def stop_request_timer(error=None):
+    """
+    Remove current request from requests in flight.
+
+    Runs on teardown so that requests failing before a response is built
+    are not left in flight.
+
+    :param error:
+    :return:
+    """
+    route = g.pop('metrics_route', None)
+    if route is not None:
+        REQUESTS_IN_FLIGHT.labels(route).dec()
+
+
+@contextmanager
+def time_auth():
+    """
+    Record time spent verifying token of current request.
+
+    :return:
+    """
+    start_time = time.perf_counter()
+    result = 'failure'
+    try:
+        yield
+        result = 'success'
+    finally:
+        AUTH_DURATION.labels(result).observe(time.perf_counter() - start_time)
+
+
+def get_registry():
+    """
+    Return registry with metrics of every worker.
+
+    When PROMETHEUS_MULTIPROC_DIR is set, every gunicorn worker writes its
+    values to its own memory mapped file in that directory and the files
+    are merged on collection, otherwise values of this process are used.
+
+    :return:
+    """
+    if not METRICS_MULTIPROC_DIR:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics():
+    """
+    Return metrics in Prometheus text format.
+
+    :return:
+    """
+    observe_pool()
+    observe_stats()
+    return Response(generate_latest(get_registry()),
+                    content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """
+    Collect request metrics of app and serve them at /metrics.
+
+    :param app:
+    :return:
+    """
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
+    app.teardown_request(stop_request_timer)
+    app.add_url_rule('/metrics', 'metrics', metrics)
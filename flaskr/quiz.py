@@ -0,0 +1,941 @@
+"""Quiz module for flaskr app."""
+
+import heapq
+import random
+import secrets
+import sys
+import threading
+import time
+
+from flaskr.utils import get_data_version_value
+
+from models import (
+    Question, db, on_change, quiz_session_question_table, quiz_session_table
+)
+
+from settings import QUESTION_INDEX_TTL, QUIZ_SESSION_TTL
+
+from sqlalchemy import select
+
+ALL_CATEGORIES = 0
+MAX_REJECTIONS = 32
+DIFFICULTY_WEIGHT_DECAY = 0.5
+MIN_DIFFICULTY_WEIGHT = sys.float_info.min
+
+
+def get_category_key(category):
+    """
+    Return key of the index bucket for given category.
+
+    Clients send category as string or integer, both are normalized to
+    integer.
+
+    :param category:
+    :return:
+    """
+    try:
+        return int(category)
+    except (TypeError, ValueError):
+        return category
+
+
+def get_difficulty_weight(difficulty, target_difficulty):
+    """
+    Return weight of questions of difficulty for quizzes targeting another.
+
+    Weight halves with every level between both difficulties, it stays
+    positive however far they are.
+
+    :param difficulty:
+    :param target_difficulty:
+    :return:
+    """
+    return max(
+        DIFFICULTY_WEIGHT_DECAY ** abs(difficulty - target_difficulty),
+        MIN_DIFFICULTY_WEIGHT
+    )
+
+
+def clamp_difficulty(target_difficulty, levels):
+    """
+    Clamp target difficulty to the range of given difficulties.
+
+    Weights beyond the range keep the same proportions, clamping keeps
+    them from underflowing.
+
+    :param target_difficulty:
+    :param levels: difficulties of a category, not empty
+    :return:
+    """
+    return min(max(target_difficulty, min(levels)), max(levels))
+
+
+def build_alias_table(weights):
+    """
+    Build Walker alias table of given weights with Vose's method.
+
+    :param weights: positive weights
+    :return: probabilities and aliases, one of each per weight
+    """
+    count = len(weights)
+    total = sum(weights)
+    scaled = [weight * count / total for weight in weights]
+    probabilities = [1.0] * count
+    aliases = list(range(count))
+    small = [i for i, weight in enumerate(scaled) if weight < 1]
+    large = [i for i, weight in enumerate(scaled) if weight >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] += scaled[less] - 1
+        (small if scaled[more] < 1 else large).append(more)
+
+    return probabilities, aliases
+
+
+def draw_alias(probabilities, aliases):
+    """
+    Draw index from Walker alias table in O(1).
+
+    :param probabilities:
+    :param aliases:
+    :return:
+    """
+    index = random.randrange(len(probabilities))
+    return index if random.random() < probabilities[index] \
+        else aliases[index]
+
+
+def weighted_sample(weighted_ids, count):
+    """
+    Sample ids without replacement in one pass, more likely by weight.
+
+    Every id gets key random ** (1 / weight) and the largest keys win, as
+    described by Efraimidis and Spirakis.
+
+    :param weighted_ids: iterable of id and weight pairs
+    :param count: number of ids to return at most
+    :return: sampled ids, most likely first
+    """
+    keys = {
+        question_id: random.random() ** (1 / weight)
+        for question_id, weight in weighted_ids
+    }
+    return heapq.nlargest(count, keys, key=keys.get)
+
+
+class QuestionIndex:
+    """
+    In-memory index of question ids per category.
+
+    Every bucket is a list of ids plus the position of every id in that
+    list, so ids are added and removed in O(1) and a random id is picked
+    in O(1) with rejection sampling against the excluded ids.
+
+    Ids are also bucketed per category and difficulty. Weighted picks draw
+    a difficulty from an alias table over the difficulties of the category,
+    then an id of that difficulty, so a pick does not depend on the size
+    of the category. Alias tables of a category are dropped on every write
+    to it and rebuilt on next pick from the bucket sizes only.
+
+    Expired or invalidated indexes are rebuilt outside of the lock by one
+    thread while the others keep picking from the previous index. When
+    ``key`` changes, questions added since the index was loaded are added
+    without rebuilding it.
+    """
+
+    def __init__(self, ttl=None, key=None):
+        """
+        Init method of class.
+
+        :param ttl: seconds after which index is loaded again from database
+        :param key: callable returning version of the questions, None if
+        only ttl and invalidation apply
+        """
+        self.ttl = ttl
+        self.key = key
+        self._buckets = None
+        self._categories = {}
+        self._difficulties = {}
+        self._levels = {}
+        self._alias_tables = {}
+        self._max_id = 0
+        self._version = None
+        self._stale = False
+        self._loaded_at = None
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+
+    def choose(self, category_id, excluded=(), target_difficulty=None):
+        """
+        Return random question id of category which is not excluded.
+
+        :param category_id: category id, 0 for all categories
+        :param excluded: ids which must not be returned
+        :param target_difficulty: difficulty to prefer, None to pick
+        uniformly
+        :return: question id or None if there is no question left
+        """
+        excluded = excluded if isinstance(excluded, (set, frozenset)) \
+            else set(excluded)
+
+        self._refresh()
+        with self._lock:
+            return self._choose(category_id, excluded, target_difficulty)
+
+    def _choose(self, category_id, excluded, target_difficulty):
+        """
+        Return random question id of category, caller must hold the lock.
+
+        :param category_id: category id, 0 for all categories
+        :param excluded: set of ids which must not be returned
+        :param target_difficulty: difficulty to prefer, None to pick
+        uniformly
+        :return: question id or None if there is no question left
+        """
+        if target_difficulty is not None:
+            return self._choose_weighted(
+                get_category_key(category_id), excluded,
+                target_difficulty
+            )
+
+        ids, _ = self._buckets.get(
+            get_category_key(category_id), ([], None)
+        )
+        if not ids:
+            return None
+
+        # Most quizzes exclude a small share of the bucket, so a few
+        # random draws find an allowed id without scanning the bucket.
+        if len(excluded) * 2 <= len(ids):
+            for _ in range(MAX_REJECTIONS):
+                question_id = ids[random.randrange(len(ids))]
+                if question_id not in excluded:
+                    return question_id
+
+        allowed = [
+            question_id for question_id in ids
+            if question_id not in excluded
+        ]
+        return random.choice(allowed) if allowed else None
+
+    def sample(self, category_id, count, excluded=(),
+               target_difficulty=None):
+        """
+        Return up to count distinct random question ids of category.
+
+        Ids are drawn one by one with choose while the excluded and
+        sampled ids are a small share of the bucket, otherwise allowed ids
+        are sampled in one scan of the bucket.
+
+        :param category_id: category id, 0 for all categories
+        :param count: number of ids to return at most
+        :param excluded: ids which must not be returned
+        :param target_difficulty: difficulty to prefer, None to pick
+        uniformly
+        :return: list of question ids
+        """
+        excluded = set(excluded)
+        self._refresh()
+        with self._lock:
+            ids, _ = self._buckets.get(
+                get_category_key(category_id), ([], None)
+            )
+            if (len(excluded) + count) * 2 > len(ids):
+                if target_difficulty is not None:
+                    return weighted_sample(
+                        (
+                            (question_id, weight)
+                            for question_id, weight in self._get_weighted_ids(
+                                category_id, target_difficulty
+                            )
+                            if question_id not in excluded
+                        ),
+                        count
+                    )
+
+                allowed = [
+                    question_id for question_id in ids
+                    if question_id not in excluded
+                ]
+                return random.sample(allowed, min(count, len(allowed)))
+
+            sampled = []
+            for _ in range(count):
+                question_id = self._choose(
+                    category_id, excluded, target_difficulty
+                )
+                if question_id is None:
+                    break
+
+                sampled.append(question_id)
+                excluded.add(question_id)
+            return sampled
+
+    def get_ids(self, category_id):
+        """
+        Return copy of question ids of given category.
+
+        :param category_id: category id, 0 for all categories
+        :return:
+        """
+        self._refresh()
+        with self._lock:
+            ids, _ = self._buckets.get(
+                get_category_key(category_id), ([], None)
+            )
+            return list(ids)
+
+    def get_weighted_ids(self, category_id, target_difficulty):
+        """
+        Return question ids of category with their weight for difficulty.
+
+        Questions without difficulty are left out.
+
+        :param category_id: category id, 0 for all categories
+        :param target_difficulty: difficulty to prefer
+        :return: list of id and weight pairs
+        """
+        self._refresh()
+        with self._lock:
+            return self._get_weighted_ids(category_id, target_difficulty)
+
+    def _get_weighted_ids(self, category_id, target_difficulty):
+        """
+        Return weighted question ids of category, caller must hold the lock.
+
+        :param category_id: category id, 0 for all categories
+        :param target_difficulty: difficulty to prefer
+        :return: list of id and weight pairs
+        """
+        category = get_category_key(category_id)
+        levels = self._levels.get(category)
+        if not levels:
+            return []
+
+        target_difficulty = clamp_difficulty(target_difficulty, levels)
+        return [
+            (question_id, get_difficulty_weight(level, target_difficulty))
+            for level in levels
+            for question_id in self._buckets[(category, level)][0]
+        ]
+
+    def add(self, question_id, category, difficulty=None):
+        """
+        Add question id to its category bucket and to all questions bucket.
+
+        :param question_id:
+        :param category:
+        :param difficulty:
+        :return:
+        """
+        with self._lock:
+            if self._buckets is None:
+                return
+
+            self.remove(question_id)
+            self._max_id = max(self._max_id, question_id)
+            category = get_category_key(category)
+            self._categories[question_id] = category
+            self._difficulties[question_id] = difficulty
+            self._add_to_bucket(ALL_CATEGORIES, question_id)
+            self._add_to_level(ALL_CATEGORIES, difficulty, question_id)
+            if category is not None:
+                self._add_to_bucket(category, question_id)
+                self._add_to_level(category, difficulty, question_id)
+
+    def remove(self, question_id):
+        """
+        Remove question id from the index.
+
+        :param question_id:
+        :return:
+        """
+        with self._lock:
+            if self._buckets is None \
+                    or question_id not in self._categories:
+                return
+
+            category = self._categories.pop(question_id)
+            difficulty = self._difficulties.pop(question_id)
+            self._remove_from_bucket(ALL_CATEGORIES, question_id)
+            self._remove_from_level(ALL_CATEGORIES, difficulty, question_id)
+            if category is not None:
+                self._remove_from_bucket(category, question_id)
+                self._remove_from_level(category, difficulty, question_id)
+
+    def invalidate(self):
+        """
+        Mark the index stale so that it is loaded again on next use.
+
+        Until the new index is loaded picks are served from the current one.
+
+        :return:
+        """
+        with self._lock:
+            self._stale = True
+
+    def _refresh(self):
+        """
+        Load the index if missing, expired, stale or behind the key.
+
+        Only the thread which loads the index first blocks, later reloads
+        are done by one thread while the others use the current index.
+
+        :return:
+        """
+        version = self.key() if self.key is not None else None
+        if self._buckets is None:
+            with self._load_lock:
+                if self._buckets is None:
+                    self._rebuild(version)
+            return
+
+        expired = self.ttl is not None \
+            and time.monotonic() - self._loaded_at >= self.ttl
+        if not expired and not self._stale and version == self._version:
+            return
+
+        if not self._load_lock.acquire(blocking=False):
+            return
+
+        try:
+            if expired or self._stale:
+                self._rebuild(version)
+            elif version != self._version:
+                self._load_new(version)
+        finally:
+            self._load_lock.release()
+
+    def _rebuild(self, version):
+        """
+        Load ids of all questions into a new index and swap it in.
+
+        :param version: key of the loaded questions
+        :return:
+        """
+        loaded_at = time.monotonic()
+        index = QuestionIndex()
+        index._buckets = {ALL_CATEGORIES: ([], {})}
+        rows = db.session.query(
+            Question.id, Question.category, Question.difficulty
+        ).order_by(Question.id)
+        for question_id, category, difficulty in rows:
+            index.add(question_id, category, difficulty)
+
+        with self._lock:
+            self._buckets = index._buckets
+            self._categories = index._categories
+            self._difficulties = index._difficulties
+            self._levels = index._levels
+            self._alias_tables = {}
+            self._max_id = index._max_id
+            self._version = version
+            self._stale = False
+            self._loaded_at = loaded_at
+
+    def _load_new(self, version):
+        """
+        Add questions created since the index was loaded.
+
+        :param version: key of the loaded questions
+        :return:
+        """
+        rows = db.session.query(
+            Question.id, Question.category, Question.difficulty
+        ).filter(Question.id > self._max_id).order_by(Question.id).all()
+        with self._lock:
+            for question_id, category, difficulty in rows:
+                self.add(question_id, category, difficulty)
+            self._version = version
+
+    def _choose_weighted(self, category, excluded, target_difficulty):
+        """
+        Return random id of category weighted by distance to difficulty.
+
+        Caller must hold the lock.
+
+        :param category: category key
+        :param excluded: ids which must not be returned
+        :param target_difficulty: difficulty to prefer
+        :return: question id or None if there is no question left
+        """
+        levels, probabilities, aliases = self._get_alias_table(
+            category, target_difficulty
+        )
+        if not levels:
+            return None
+
+        ids, _ = self._buckets[category]
+        if len(excluded) * 2 <= len(ids):
+            for _ in range(MAX_REJECTIONS):
+                level = levels[draw_alias(probabilities, aliases)]
+                level_ids, _ = self._buckets[(category, level)]
+                question_id = level_ids[random.randrange(len(level_ids))]
+                if question_id not in excluded:
+                    return question_id
+
+        target_difficulty = clamp_difficulty(target_difficulty, levels)
+        allowed, weights = [], []
+        for level in levels:
+            weight = get_difficulty_weight(level, target_difficulty)
+            for question_id in self._buckets[(category, level)][0]:
+                if question_id not in excluded:
+                    allowed.append(question_id)
+                    weights.append(weight)
+        return random.choices(allowed, weights)[0] if allowed else None
+
+    def _get_alias_table(self, category, target_difficulty):
+        """
+        Return alias table of difficulties of category, building it if needed.
+
+        Target is clamped to the difficulties of the category as weights
+        beyond them keep the same proportions, which bounds the number of
+        tables per category.
+
+        :param category: category key
+        :param target_difficulty: difficulty to prefer
+        :return: difficulties, probabilities and aliases
+        """
+        levels = self._levels.get(category)
+        if not levels:
+            return (), (), ()
+
+        target_difficulty = clamp_difficulty(target_difficulty, levels)
+        tables = self._alias_tables.setdefault(category, {})
+        table = tables.get(target_difficulty)
+        if table is None:
+            levels = sorted(levels)
+            weights = [
+                get_difficulty_weight(level, target_difficulty)
+                * len(self._buckets[(category, level)][0])
+                for level in levels
+            ]
+            table = (levels, *build_alias_table(weights))
+            tables[target_difficulty] = table
+
+        return table
+
+    def _add_to_level(self, category, difficulty, question_id):
+        """
+        Append question id to bucket of category and difficulty.
+
+        :param category:
+        :param difficulty:
+        :param question_id:
+        :return:
+        """
+        if difficulty is None:
+            return
+
+        self._levels.setdefault(category, set()).add(difficulty)
+        self._add_to_bucket((category, difficulty), question_id)
+        self._alias_tables.pop(category, None)
+
+    def _remove_from_level(self, category, difficulty, question_id):
+        """
+        Remove question id from bucket of category and difficulty.
+
+        :param category:
+        :param difficulty:
+        :param question_id:
+        :return:
+        """
+        if difficulty is None:
+            return
+
+        key = (category, difficulty)
+        self._remove_from_bucket(key, question_id)
+        if not self._buckets[key][0]:
+            del self._buckets[key]
+            self._levels[category].discard(difficulty)
+        self._alias_tables.pop(category, None)
+
+    def _add_to_bucket(self, key, question_id):
+        """
+        Append question id to bucket.
+
+        :param key:
+        :param question_id:
+        :return:
+        """
+        ids, positions = self._buckets.setdefault(key, ([], {}))
+        positions[question_id] = len(ids)
+        ids.append(question_id)
+
+    def _remove_from_bucket(self, key, question_id):
+        """
+        Remove question id from bucket by swapping it with last id.
+
+        :param key:
+        :param question_id:
+        :return:
+        """
+        ids, positions = self._buckets[key]
+        position = positions.pop(question_id)
+        last_id = ids.pop()
+        if last_id != question_id:
+            ids[position] = last_id
+            positions[last_id] = position
+
+
+question_index = QuestionIndex(
+    ttl=QUESTION_INDEX_TTL, key=get_data_version_value
+)
+
+
+@on_change
+def update_question_index(table, action, instance, changes):
+    """
+    Keep question index in sync with question writes.
+
+    :param table:
+    :param action:
+    :param instance:
+    :param changes:
+    :return:
+    """
+    if table != Question.__tablename__:
+        return
+
+    if action == 'import':
+        question_index.invalidate()
+    elif action == 'delete':
+        question_index.remove(instance.id)
+    else:
+        question_index.add(instance.id, instance.category, instance.difficulty)
+
+
+def get_question_row(question_id):
+    """
+    Return formatted question by given id without building the model.
+
+    :param question_id:
+    :return:
+    """
+    row = db.session.query(*Question.columns()) \
+        .filter(Question.id == question_id).first()
+    return Question.format_row(row) if row is not None else None
+
+
+def get_question_rows(question_ids):
+    """
+    Return formatted questions by given ids with one query.
+
+    :param question_ids:
+    :return: map of id to formatted question, missing ids are left out
+    """
+    rows = db.session.query(*Question.columns()) \
+        .filter(Question.id.in_(question_ids))
+    return {row[0]: Question.format_row(row) for row in rows}
+
+
+def get_random_question(category_id, previous_questions,
+                        target_difficulty=None):
+    """
+    Return random formatted question of category not in previous questions.
+
+    Only the chosen question is loaded from database. Ids of questions
+    deleted by another worker are dropped from the index and skipped.
+
+    :param category_id: category id, 0 for all categories
+    :param previous_questions: ids of questions already asked
+    :param target_difficulty: difficulty to prefer, None to pick uniformly
+    :return:
+    """
+    excluded = set(previous_questions)
+    while True:
+        question_id = question_index.choose(
+            category_id, excluded, target_difficulty
+        )
+        if question_id is None:
+            return None
+
+        question = get_question_row(question_id)
+        if question is not None:
+            return question
+
+        question_index.remove(question_id)
+        excluded.add(question_id)
+
+
+def get_random_questions(category_id, previous_questions, count,
+                         target_difficulty=None):
+    """
+    Return up to count distinct random formatted questions of category.
+
+    Questions are sampled without replacement and loaded with one query.
+    Ids of questions deleted by another worker are dropped from the index
+    and replaced.
+
+    :param category_id: category id, 0 for all categories
+    :param previous_questions: ids of questions already asked
+    :param count: number of questions to return at most
+    :param target_difficulty: difficulty to prefer, None to pick uniformly
+    :return: list of formatted questions
+    """
+    excluded = set(previous_questions)
+    questions = []
+    while len(questions) < count:
+        question_ids = question_index.sample(
+            category_id, count - len(questions), excluded, target_difficulty
+        )
+        if not question_ids:
+            break
+
+        rows = get_question_rows(question_ids)
+        for question_id in question_ids:
+            excluded.add(question_id)
+            if question_id in rows:
+                questions.append(rows[question_id])
+            else:
+                question_index.remove(question_id)
+
+    return questions
+
+
+class QuizSession:
+    """Quiz played on the server from a pre-shuffled deck of question ids."""
+
+    def __init__(self, owner, remaining, session_id=None):
+        """
+        Init method of class.
+
+        :param owner: subject of the token which started the session
+        :param remaining: number of questions left in the deck
+        :param session_id: id of a stored session, None for a new one
+        """
+        self.id = session_id or secrets.token_urlsafe(16)
+        self.owner = owner
+        self.remaining = remaining
+
+
+class QuizSessionStore:
+    """
+    Quiz sessions stored in the primary database, shared by all workers.
+
+    The deck is written once when the session starts, one row per question
+    by position, next question is the last remaining one. Every request
+    lowers the number of remaining questions, provided no other request
+    did meanwhile, and reads only the ids below the old number. Every
+    access extends the session by ``ttl`` seconds, expired sessions are
+    deleted when new ones start.
+    """
+
+    def __init__(self, ttl=QUIZ_SESSION_TTL):
+        """
+        Init method of class.
+
+        :param ttl: seconds of inactivity after which session expires
+        """
+        self.ttl = ttl
+
+    def create(self, category_id, previous_questions=(), owner=None,
+               target_difficulty=None):
+        """
+        Start session with shuffled questions of category.
+
+        With a target difficulty the deck is shuffled by weight, questions
+        closer to it are more likely to come first.
+
+        :param category_id: category id, 0 for all categories
+        :param previous_questions: ids of questions already asked
+        :param owner: subject of the token starting the session
+        :param target_difficulty: difficulty to prefer, None to shuffle
+        uniformly
+        :return:
+        """
+        excluded = set(previous_questions)
+        if target_difficulty is None:
+            ids = [
+                question_id
+                for question_id in question_index.get_ids(category_id)
+                if question_id not in excluded
+            ]
+            random.shuffle(ids)
+        else:
+            weighted_ids = [
+                (question_id, weight)
+                for question_id, weight in question_index.get_weighted_ids(
+                    category_id, target_difficulty
+                )
+                if question_id not in excluded
+            ]
+            # Deck is popped from the end, most likely questions go last.
+            ids = weighted_sample(weighted_ids, len(weighted_ids))[::-1]
+        session = QuizSession(owner, len(ids))
+
+        now = time.time()
+        expired = select([quiz_session_table.c.id]).where(
+            quiz_session_table.c.expires_at <= now
+        )
+        with db.engine.begin() as connection:
+            connection.execute(quiz_session_question_table.delete().where(
+                quiz_session_question_table.c.session_id.in_(expired)
+            ))
+            connection.execute(quiz_session_table.delete().where(
+                quiz_session_table.c.expires_at <= now
+            ))
+            connection.execute(quiz_session_table.insert().values(
+                id=session.id, owner=owner, remaining=session.remaining,
+                expires_at=now + self.ttl
+            ))
+            if ids:
+                connection.execute(quiz_session_question_table.insert(), [
+                    {
+                        'session_id': session.id, 'position': position,
+                        'question_id': question_id
+                    }
+                    for position, question_id in enumerate(ids)
+                ])
+
+        return session
+
+    def get(self, session_id, owner=None):
+        """
+        Return session by given id or None if it is missing or expired.
+
+        :param session_id:
+        :param owner: subject of the token, must match session owner
+        :return:
+        """
+        session = self._load(session_id)
+        if session is None or session.owner != owner:
+            return None
+
+        return session
+
+    def next_question(self, session):
+        """
+        Pop next question of session and return it formatted.
+
+        Session is dropped once its deck is empty.
+
+        :param session:
+        :return: formatted question or None when quiz is over
+        """
+        questions = self.next_questions(session, 1)
+        return questions[0] if questions else None
+
+    def next_questions(self, session, count):
+        """
+        Pop up to count next questions of session and return them formatted.
+
+        Questions are loaded with one query, deleted ones are replaced by
+        the next of the deck. Session is dropped once its deck is empty.
+
+        :param session:
+        :param count:
+        :return: formatted questions, empty when quiz is over
+        """
+        questions = []
+        while len(questions) < count:
+            question_ids = self._pop(session, count - len(questions))
+            if not question_ids:
+                if not questions:
+                    self._delete(session)
+                break
+
+            rows = get_question_rows(question_ids)
+            questions.extend(
+                rows[question_id] for question_id in question_ids
+                if question_id in rows
+            )
+
+        return questions
+
+    def _load(self, session_id):
+        """
+        Read unexpired session from primary database.
+
+        :param session_id:
+        :return: session with its number of remaining questions or None
+        """
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select([
+                    quiz_session_table.c.id, quiz_session_table.c.owner,
+                    quiz_session_table.c.remaining
+                ])
+                .where(quiz_session_table.c.id == session_id)
+                .where(quiz_session_table.c.expires_at > time.time())
+            ).first()
+
+        if row is None:
+            return None
+
+        return QuizSession(row.owner, row.remaining, row.id)
+
+    def _pop(self, session, count):
+        """
+        Pop up to count question ids of session and store what remains.
+
+        When another request popped from the session meanwhile, its number
+        of remaining questions is reloaded and popped again so that no
+        question is asked twice.
+
+        :param session:
+        :param count:
+        :return: popped question ids, none when deck is empty
+        """
+        while True:
+            remaining = session.remaining
+            if remaining <= 0:
+                return []
+
+            start = max(remaining - count, 0)
+            with db.engine.begin() as connection:
+                updated = connection.execute(
+                    quiz_session_table.update()
+                    .where(quiz_session_table.c.id == session.id)
+                    .where(quiz_session_table.c.remaining == remaining)
+                    .values(remaining=start, expires_at=time.time() + self.ttl)
+                ).rowcount
+                if updated:
+                    session.remaining = start
+                    return [
+                        row.question_id for row in connection.execute(
+                            select([quiz_session_question_table.c.question_id])
+                            .where(
+                                quiz_session_question_table.c.session_id
+                                == session.id
+                            )
+                            .where(
+                                quiz_session_question_table.c.position
+                                >= start
+                            )
+                            .where(
+                                quiz_session_question_table.c.position
+                                < remaining
+                            )
+                            .order_by(
+                                quiz_session_question_table.c.position.desc()
+                            )
+                        )
+                    ]
+
+            stored = self._load(session.id)
+            if stored is None:
+                return []
+
+            session.remaining = stored.remaining
+
+    @staticmethod
+    def _delete(session):
+        """
+        Delete session from database.
+
+        :param session:
+        :return:
+        """
+        with db.engine.begin() as connection:
+            connection.execute(quiz_session_question_table.delete().where(
+                quiz_session_question_table.c.session_id == session.id
+            ))
+            connection.execute(quiz_session_table.delete().where(
+                quiz_session_table.c.id == session.id
+            ))
+
+
+quiz_sessions = QuizSessionStore()
@@ -0,0 +1,87 @@
+"""Read replica routing module for flaskr app."""
+
+import time
+from functools import wraps
+
+from flask import g, request
+
+from flaskr.constants import REPLICA_STICKY_COOKIE
+
+from models import replicas
+
+from settings import REPLICA_STICKY_TTL
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def reads_from_primary():
+    """
+    Check if client of current request wrote recently.
+
+    Clients get a cookie after every successful write, their reads go to
+    the primary until it expires so that they see their own writes
+    whatever the replication lag.
+
+    :return:
+    """
+    try:
+        until = int(request.cookies.get(REPLICA_STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+
+    return time.time() < until <= time.time() + REPLICA_STICKY_TTL
+
+
+def read_only(function):
+    """
+    Send queries of decorated route to a replica when there is one.
+
+    Route must not write, even with a POST method, so that its requests
+    do not make the client read from primary.
+
+    :param function:
+    :return:
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        """
+        Decorate wrapper method.
+
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        g.read_route = True
+        g.read_only = not reads_from_primary()
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def mark_writer(response):
+    """
+    Make client of successful write read from primary for a while.
+
+    :param response:
+    :return: response with sticky cookie after writes
+    """
+    if replicas.bind_keys and request.method not in SAFE_METHODS \
+            and not g.get('read_route', False) \
+            and response.status_code < 400:
+        response.set_cookie(
+            REPLICA_STICKY_COOKIE,
+            str(int(time.time()) + REPLICA_STICKY_TTL),
+            max_age=REPLICA_STICKY_TTL, httponly=True, samesite='Lax'
+        )
+    return response
+
+
+def init_replica_routing(app):
+    """
+    Make clients of app read their own writes.
+
+    :param app:
+    :return:
+    """
+    app.after_request(mark_writer)
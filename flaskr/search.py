@@ -0,0 +1,249 @@
+"""Search module for flaskr app."""
+
+import threading
+import time
+
+from flaskr.cache import CachedValue
+
+from models import Question, db, on_change
+
+from settings import SEARCH_INDEX_TTL
+
+from sqlalchemy import func, text
+
+
+def get_trigrams(value):
+    """
+    Return set of three letter substrings of given lowercase value.
+
+    :param value:
+    :return:
+    """
+    return {value[index:index + 3] for index in range(len(value) - 2)}
+
+
+class QuestionSearchIndex:
+    """
+    In-memory trigram inverted index of question texts.
+
+    Used when database is not postgres. Candidates are the questions
+    sharing every trigram of the query, which are then checked for the
+    whole query, so results are the same as a case insensitive substring
+    search without scanning every question.
+    """
+
+    def __init__(self, ttl=None):
+        """
+        Init method of class.
+
+        :param ttl: seconds after which index is loaded again from database
+        """
+        self.ttl = ttl
+        self._texts = None
+        self._postings = {}
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def search(self, query):
+        """
+        Return ids of questions containing query, best matches first.
+
+        :param query:
+        :return:
+        """
+        query = query.lower()
+        with self._lock:
+            self._ensure_loaded()
+            trigrams = get_trigrams(query)
+            if trigrams:
+                postings = sorted(
+                    (self._postings.get(trigram, set())
+                     for trigram in trigrams),
+                    key=len
+                )
+                candidates = set.intersection(*postings)
+            else:
+                candidates = self._texts.keys()
+
+            matches = [
+                (get_rank(query, self._texts[question_id]), question_id)
+                for question_id in candidates
+                if query in self._texts[question_id]
+            ]
+
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [question_id for _, question_id in matches]
+
+    def add(self, question_id, question):
+        """
+        Index text of given question.
+
+        :param question_id:
+        :param question: text of question
+        :return:
+        """
+        with self._lock:
+            if self._texts is None:
+                return
+
+            self.remove(question_id)
+            value = (question or '').lower()
+            self._texts[question_id] = value
+            for trigram in get_trigrams(value):
+                self._postings.setdefault(trigram, set()).add(question_id)
+
+    def remove(self, question_id):
+        """
+        Remove question from the index.
+
+        :param question_id:
+        :return:
+        """
+        with self._lock:
+            if self._texts is None or question_id not in self._texts:
+                return
+
+            value = self._texts.pop(question_id)
+            for trigram in get_trigrams(value):
+                self._postings[trigram].discard(question_id)
+
+    def invalidate(self):
+        """
+        Drop the index so that it is loaded again on next search.
+
+        :return:
+        """
+        with self._lock:
+            self._texts = None
+            self._postings = {}
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        """
+        Load texts of all questions if index is missing or expired.
+
+        :return:
+        """
+        if self._texts is not None and (
+                self.ttl is None
+                or time.monotonic() - self._loaded_at < self.ttl):
+            return
+
+        self._texts = {}
+        self._postings = {}
+        self._loaded_at = time.monotonic()
+        rows = db.session.query(Question.id, Question.question)
+        for question_id, question in rows:
+            self.add(question_id, question)
+
+
+def get_rank(query, value):
+    """
+    Rank match of query in value, higher is better.
+
+    Matches at start of a word rank first, then shorter questions.
+
+    :param query: lowercase query
+    :param value: lowercase question text
+    :return:
+    """
+    position = value.find(query)
+    at_word_start = position == 0 or not value[position - 1].isalnum()
+    return int(at_word_start) + (len(query) / len(value) if value else 0)
+
+
+search_index = QuestionSearchIndex(ttl=SEARCH_INDEX_TTL)
+
+
+@on_change
+def update_search_index(table, action, instance, changes):
+    """
+    Keep search index in sync with question writes.
+
+    :param table:
+    :param action:
+    :param instance:
+    :param changes:
+    :return:
+    """
+    if table != Question.__tablename__:
+        return
+
+    if action == 'import':
+        search_index.invalidate()
+    elif action == 'delete':
+        search_index.remove(instance.id)
+    else:
+        search_index.add(instance.id, instance.question)
+
+
+def load_trigram_search():
+    """
+    Check if pg_trgm extension used to rank results is installed.
+
+    :return:
+    """
+    return db.session.execute(text(
+        "SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'"
+    )).scalar() > 0
+
+
+trigram_search = CachedValue(load_trigram_search)
+
+
+def escape_like(query):
+    """
+    Escape wildcards of LIKE pattern.
+
+    :param query:
+    :return:
+    """
+    return query.replace('\\', '\\\\').replace('%', '\\%') \
+        .replace('_', '\\_')
+
+
+def search_questions(query, page=1, limit=10):
+    """
+    Return page of questions containing query and total number of matches.
+
+    On postgres the search uses the trigram index created by migrations and
+    ranks results by word similarity, other databases use the in-memory
+    search index.
+
+    :param query: text to search, all questions are returned if empty
+    :param page:
+    :param limit: number of questions per page
+    :return: list of questions and total number of matching questions
+    """
+    if page < 1:
+        return [], 0
+
+    start = (page - 1) * limit
+    if db.engine.dialect.name != 'postgresql':
+        question_ids = search_index.search(query or '')
+        page_ids = question_ids[start:start + limit]
+        rows = db.session.query(*Question.columns()) \
+            .filter(Question.id.in_(page_ids))
+        questions = {row[0]: Question.format_row(row) for row in rows}
+        return [
+            questions[question_id] for question_id in page_ids
+            if question_id in questions
+        ], len(question_ids)
+
+    questions = db.session.query(*Question.columns())
+    if query:
+        questions = questions.filter(
+            Question.question.ilike(f'%{escape_like(query)}%', escape='\\')
+        )
+
+    total = questions.order_by(None).count()
+    if query and trigram_search.get():
+        questions = questions.order_by(
+            func.word_similarity(query, Question.question).desc(),
+            Question.id
+        )
+    else:
+        questions = questions.order_by(Question.id)
+
+    rows = questions.offset(start).limit(limit)
+    return [Question.format_row(row) for row in rows], total
@@ -0,0 +1,60 @@
+"""Serialization module for flaskr app."""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+from settings import JSON_ENCODER
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+USE_ORJSON = orjson is not None and JSON_ENCODER in ('auto', 'orjson')
+
+
+def dumps(obj):
+    """
+    Encode obj to json string with the configured encoder.
+
+    :param obj:
+    :return:
+    """
+    if USE_ORJSON:
+        return orjson.dumps(
+            obj, default=DefaultJSONProvider.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+        ).decode()
+
+    return json.dumps(
+        obj, default=DefaultJSONProvider.default, sort_keys=True,
+        separators=(',', ':')
+    )
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider of the app encoding responses with orjson.
+
+    Falls back to the default provider when orjson is not installed,
+    JSON_ENCODER is json, or responses are pretty printed.
+    """
+
+    def response(self, *args, **kwargs):
+        """
+        Serialize given arguments as a JSON response.
+
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        pretty = self.compact is False \
+            or (self.compact is None and self._app.debug)
+        if not USE_ORJSON or pretty:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            f'{dumps(obj)}\n', mimetype=self.mimetype
+        )
@@ -1,8 +1,15 @@
 """Utils module for flaskr app."""
 
+from flaskr.cache import CachedValue
 from flaskr.constants import QUESTIONS_PER_PAGE
 
-from models import Category, Question
+from models import Category, Question, db, get_data_version, on_change
+
+from settings import (
+    APPROXIMATE_COUNT_THRESHOLD, CATEGORIES_CACHE_TTL, QUESTIONS_COUNT_TTL
+)
+
+from sqlalchemy import func, text
 
 
 def get_page_range(page):
@@ -18,9 +25,9 @@ def get_page_range(page):
     return start, end
 
 
-def get_all_categories():
+def load_categories():
     """
-    Get all categories.
+    Load map of category id to category type from database.
 
     :return:
     """
@@ -31,47 +38,234 @@ def get_all_categories():
     return categories
 
 
+categories_cache = CachedValue(load_categories, ttl=CATEGORIES_CACHE_TTL)
+
+
+def invalidate_categories():
+    """
+    Drop cached categories so that they are loaded again on next read.
+
+    :return:
+    """
+    categories_cache.invalidate()
+
+
+@on_change
+def invalidate_categories_on_change(table, action, instance, changes):
+    """
+    Invalidate cached categories when a category is written.
+
+    :param table:
+    :param action:
+    :param instance:
+    :param changes:
+    :return:
+    """
+    if table == Category.__tablename__:
+        invalidate_categories()
+
+
+def parse_bool(value):
+    """
+    Parse boolean query argument.
+
+    :param value: query argument like true, 1 or yes
+    :return:
+    """
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def get_all_categories(with_counts=False):
+    """
+    Get all categories.
+
+    :param with_counts: include number of questions of every category
+    :return: map of category id to type, or to type and total questions
+    when with_counts is set
+    """
+    categories = categories_cache.get()
+    if not with_counts:
+        return dict(categories)
+
+    counts = question_counts.get()
+    return {
+        category_id: {
+            'type': category_type,
+            'total_questions': counts.get(category_id, 0)
+        }
+        for category_id, category_type in categories.items()
+    }
+
+
 def get_category_by_id(category_id):
     """
-    Return category by given category_id id.
+    Return formatted category by given category_id id.
 
     :param category_id:
     :return:
     """
-    return Category.query.get(category_id)
+    category_type = categories_cache.get().get(category_id)
+    if category_type is None:
+        return None
 
+    return {
+        'id': category_id,
+        'type': category_type
+    }
 
-def get_all_questions(query=None, category_id=None):
+
+def get_all_questions(category_id=None):
     """
-    Return list of all questions.
+    Return list of all questions, search goes through search_questions.
 
-    :param query:
     :param category_id:
     :return:
     """
-    if query:
-        questions = Question.query.filter(
-            Question.question.ilike(f'%{query}%')
-        )
-    elif category_id:
-        questions = Question.query.filter_by(category=category_id)
+    questions = db.session.query(*Question.columns())
+    if category_id:
+        questions = questions.filter_by(category=category_id) \
+            .order_by(Question.id)
     else:
-        questions = Question.query.order_by(Question.id).all()
+        questions = questions.order_by(Question.id)
 
-    serialized_data = [question.format() for question in questions]
+    serialized_data = [Question.format_row(row) for row in questions]
     return serialized_data
 
 
-def get_questions_by_page(page):
+def count_questions():
     """
-    Return list of questions by given page.
+    Count questions in the database.
+
+    :return:
+    """
+    return db.session.query(func.count(Question.id)).scalar()
+
+
+def get_data_version_value():
+    """
+    Get version of the data shared by all workers, without its date.
+
+    :return:
+    """
+    return get_data_version()[0]
+
+
+questions_count = CachedValue(
+    count_questions, ttl=QUESTIONS_COUNT_TTL, key=get_data_version_value
+)
+
+
+def count_questions_per_category():
+    """
+    Count questions of every category with one grouped query.
+
+    :return: map of category id to number of questions
+    """
+    counts = {}
+    rows = db.session.query(Question.category, func.count(Question.id)) \
+        .group_by(Question.category)
+    for category, count in rows:
+        if category is not None:
+            category = int(category)
+            counts[category] = counts.get(category, 0) + count
+
+    return counts
+
+
+question_counts = CachedValue(
+    count_questions_per_category, ttl=QUESTIONS_COUNT_TTL,
+    key=get_data_version_value
+)
+
+
+@on_change
+def invalidate_questions_count(table, action, instance, changes):
+    """
+    Invalidate cached counts when questions are added, removed or moved.
+
+    :param table:
+    :param action:
+    :param instance:
+    :param changes:
+    :return:
+    """
+    if table != Question.__tablename__:
+        return
+
+    if action in ('insert', 'delete', 'import'):
+        questions_count.invalidate()
+        question_counts.invalidate()
+    elif 'category' in changes:
+        question_counts.invalidate()
+
+
+def get_approximate_questions_count():
+    """
+    Return planner estimate of questions count, None if not available.
+
+    The estimate is read from pg_class and is only refreshed by
+    VACUUM/ANALYZE, so it is only available on postgres.
+
+    :return:
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return None
+
+    estimate = db.session.execute(text(
+        "SELECT reltuples::bigint FROM pg_class "
+        "WHERE oid = 'questions'::regclass"
+    )).scalar()
+    return estimate if estimate and estimate > 0 else None
+
+
+def get_questions_count():
+    """
+    Return total number of questions.
+
+    Exact count is cached and loaded again after writes made through any
+    worker, as the shared data version changes. When
+    APPROXIMATE_COUNT_THRESHOLD is set and the table is estimated to be
+    larger, the estimate is returned instead of counting rows.
 
-    :param page:
     :return:
     """
-    start, end = get_page_range(page)
-    questions = get_all_questions()
-    return questions[start:end]
+    if APPROXIMATE_COUNT_THRESHOLD:
+        estimate = get_approximate_questions_count()
+        if estimate and estimate >= APPROXIMATE_COUNT_THRESHOLD:
+            return estimate
+
+    return questions_count.get()
+
+
+def get_questions_by_page(page=1, after_id=None):
+    """
+    Return list of questions by given page or after given question id.
+
+    Pagination is done by the database, with LIMIT/OFFSET for page numbers
+    and with a keyset on the primary key when after_id is given, so deep
+    pages do not scan the skipped rows.
+
+    :param page:
+    :param after_id: id of last question of previous page
+    :return: list of questions and cursor for the next page
+    """
+    questions = db.session.query(*Question.columns()).order_by(Question.id)
+    if after_id is not None:
+        questions = questions.filter(Question.id > after_id)
+    elif page < 1:
+        return [], None
+    else:
+        start, _ = get_page_range(page)
+        questions = questions.offset(start)
+
+    # One extra row tells whether a next page exists.
+    questions = questions.limit(QUESTIONS_PER_PAGE + 1).all()
+    has_next = len(questions) > QUESTIONS_PER_PAGE
+    serialized_data = [
+        Question.format_row(row) for row in questions[:QUESTIONS_PER_PAGE]
+    ]
+    next_cursor = serialized_data[-1]['id'] if has_next else None
+    return serialized_data, next_cursor
 
 
 def get_question_by_id(question_id):
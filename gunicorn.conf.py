@@ -0,0 +1,60 @@
+"""Gunicorn configuration of the app."""
+
+import glob
+import os
+
+# Threads let a worker take more requests than MAX_IN_FLIGHT_REQUESTS so
+# that admission control sheds the excess instead of the socket queueing
+# it.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+# The Heroku router is the one proxy in front of the app, clients are keyed
+# on the address it forwards.
+os.environ.setdefault('TRUSTED_PROXY_COUNT', '1')
+
+
+def post_fork(server, worker):
+    """
+    Drop database connections inherited from the master process.
+
+    With --preload the app is loaded before workers are forked, any
+    connection it opened must not be shared by the workers.
+
+    :param server:
+    :param worker:
+    :return:
+    """
+    from models import dispose_connections
+
+    dispose_connections()
+
+
+def on_starting(server):
+    """
+    Remove metric files left by a previous run.
+
+    :param server:
+    :return:
+    """
+    from settings import METRICS_MULTIPROC_DIR
+
+    if METRICS_MULTIPROC_DIR:
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """
+    Drop the live gauges of an exited worker from the metrics.
+
+    :param server:
+    :param worker:
+    :return:
+    """
+    from settings import METRICS_MULTIPROC_DIR
+
+    if METRICS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
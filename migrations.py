@@ -0,0 +1,197 @@
+"""Module for database migrations."""
+
+from array import array
+from datetime import datetime
+
+from models import (
+    data_version_table, db, quiz_session_question_table, quiz_session_table
+)
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, inspect, text
+)
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', String, primary_key=True),
+    Column('applied_at', DateTime),
+)
+
+
+def create_tables(connection):
+    """
+    Create tables of the models missing from database.
+
+    Replicas are not touched, they copy the schema of the primary.
+
+    :param connection:
+    :return:
+    """
+    db.Model.metadata.create_all(connection)
+
+
+def create_questions_search_index(connection):
+    """
+    Create trigram index used by question search on postgres.
+
+    :param connection:
+    :return:
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+        'ON questions USING gin (question gin_trgm_ops)'
+    ))
+
+
+def convert_questions_category(connection):
+    """
+    Make questions.category an indexed integer foreign key of categories.
+
+    Tables created from the models stored category as string without
+    constraint. Sqlite can not alter columns, there only the index is
+    created and integer parameters still match the stored text.
+
+    :param connection:
+    :return:
+    """
+    if connection.dialect.name == 'postgresql':
+        inspector = inspect(connection)
+        columns = {
+            column['name']: column
+            for column in inspector.get_columns('questions')
+        }
+        if not isinstance(columns['category']['type'], Integer):
+            connection.execute(text(
+                'ALTER TABLE questions ALTER COLUMN category TYPE integer '
+                'USING category::integer'
+            ))
+
+        if not any(
+                foreign_key['constrained_columns'] == ['category']
+                for foreign_key in inspector.get_foreign_keys('questions')):
+            connection.execute(text(
+                'ALTER TABLE questions ADD CONSTRAINT fk_questions_category '
+                'FOREIGN KEY (category) REFERENCES categories (id) '
+                'ON UPDATE CASCADE ON DELETE SET NULL'
+            ))
+
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_questions_category_id '
+        'ON questions (category, id)'
+    ))
+
+
+def create_quiz_sessions(connection):
+    """
+    Create table of quiz sessions shared by the workers.
+
+    :param connection:
+    :return:
+    """
+    quiz_session_table.create(connection, checkfirst=True)
+
+
+def create_data_version(connection):
+    """
+    Create single row table holding the version of the data.
+
+    :param connection:
+    :return:
+    """
+    data_version_table.create(connection, checkfirst=True)
+    if connection.execute(data_version_table.select()).first() is None:
+        connection.execute(data_version_table.insert().values(
+            id=1, value=0, updated_at=datetime.utcnow().replace(microsecond=0)
+        ))
+
+
+def split_quiz_session_decks(connection):
+    """
+    Move quiz session decks into one row per question.
+
+    Sessions stored the whole deck as one blob, which every request read
+    to pop a few ids of it. Unexpired decks are copied up to their
+    remaining length, then the blob column is dropped.
+
+    :param connection:
+    :return:
+    """
+    quiz_session_question_table.create(connection, checkfirst=True)
+    columns = {
+        column['name']
+        for column in inspect(connection).get_columns('quiz_sessions')
+    }
+    if 'deck' not in columns:
+        return
+
+    rows = connection.execute(text(
+        'SELECT id, deck, remaining FROM quiz_sessions '
+        'WHERE deck IS NOT NULL'
+    )).fetchall()
+    for session_id, blob, remaining in rows:
+        deck = array('q')
+        deck.frombytes(blob)
+        if remaining:
+            connection.execute(quiz_session_question_table.insert(), [
+                {
+                    'session_id': session_id, 'position': position,
+                    'question_id': question_id
+                }
+                for position, question_id in enumerate(deck[:remaining])
+            ])
+
+    connection.execute(text('ALTER TABLE quiz_sessions DROP COLUMN deck'))
+
+
+MIGRATIONS = [
+    ('0000_create_tables', create_tables),
+    ('0001_questions_search_index', create_questions_search_index),
+    ('0002_questions_category_foreign_key', convert_questions_category),
+    ('0003_quiz_sessions', create_quiz_sessions),
+    ('0004_data_version', create_data_version),
+    ('0005_quiz_session_questions', split_quiz_session_decks),
+]
+
+
+def get_applied_migrations(connection):
+    """
+    Return versions of migrations already applied to database.
+
+    :param connection:
+    :return:
+    """
+    schema_migrations.create(connection, checkfirst=True)
+    return {
+        row.version
+        for row in connection.execute(schema_migrations.select())
+    }
+
+
+def apply_migrations(engine=None):
+    """
+    Apply pending migrations, each one in its own transaction.
+
+    :param engine: engine of database to migrate, default engine if None
+    :return: list of applied versions
+    """
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        applied = get_applied_migrations(connection)
+
+    versions = []
+    for version, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, applied_at=datetime.utcnow()
+            ))
+        versions.append(version)
+
+    return versions
@@ -1,17 +1,227 @@
 """Module for model."""
 
-from flask_sqlalchemy import SQLAlchemy
+import itertools
+import time
+from datetime import datetime, timezone
+
+from flask import g, has_app_context
+
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 
 from settings import (
-    SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS,
+    REPLICA_HEALTH_CHECK_INTERVAL, SQLALCHEMY_DATABASE_URI,
+    SQLALCHEMY_MAX_OVERFLOW, SQLALCHEMY_POOL_PRE_PING,
+    SQLALCHEMY_POOL_RECYCLE, SQLALCHEMY_POOL_SIZE, SQLALCHEMY_POOL_TIMEOUT,
+    SQLALCHEMY_REPLICA_URIS, SQLALCHEMY_TRACK_MODIFICATIONS,
     TEST_SQLALCHEMY_DATABASE_URI
 )
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Index, Integer, String, Table,
+    event, inspect, select, text
+)
+from sqlalchemy import orm
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
 
 database_name = "trivia"
 
-db = SQLAlchemy()
+
+class ReplicaSet:
+    """
+    Binds of read replicas picked round-robin, skipping unhealthy ones.
+
+    A replica is checked with SELECT 1 at most every ``check_interval``
+    seconds, and marked unhealthy as soon as a query fails to reach it.
+    """
+
+    def __init__(self, check_interval=REPLICA_HEALTH_CHECK_INTERVAL):
+        """
+        Init method of class.
+
+        :param check_interval: seconds between health checks of a replica
+        """
+        self.check_interval = check_interval
+        self.bind_keys = []
+        self._health = {}
+        self._engines = {}
+        self._counter = itertools.count()
+
+    def configure(self, bind_keys):
+        """
+        Set bind keys of the replicas.
+
+        :param bind_keys:
+        :return:
+        """
+        self.bind_keys = list(bind_keys)
+        self._health = {}
+
+    def choose(self, get_engine):
+        """
+        Return engine of next healthy replica or None if there is none.
+
+        :param get_engine: function returning engine of given bind key
+        :return:
+        """
+        for _ in range(len(self.bind_keys)):
+            index = next(self._counter) % len(self.bind_keys)
+            bind_key = self.bind_keys[index]
+            engine = get_engine(bind_key)
+            if engine not in self._engines:
+                self._engines[engine] = bind_key
+                event.listen(engine, 'handle_error', self.on_error)
+            if self.is_healthy(bind_key, engine):
+                return engine
+
+        return None
+
+    def is_healthy(self, bind_key, engine):
+        """
+        Check replica health, querying it if last check is too old.
+
+        :param bind_key:
+        :param engine:
+        :return:
+        """
+        healthy, checked_at = self._health.get(bind_key, (None, None))
+        now = time.monotonic()
+        if checked_at is None or now - checked_at >= self.check_interval:
+            healthy = self.check(engine)
+            self._health[bind_key] = (healthy, now)
+
+        return healthy
+
+    def on_error(self, context):
+        """
+        Mark replica unhealthy when a query could not reach it.
+
+        :param context: exception context of the failed query
+        :return:
+        """
+        bind_key = self._engines.get(context.engine)
+        if bind_key is not None and (
+                context.is_disconnect
+                or isinstance(context.sqlalchemy_exception,
+                              OperationalError)):
+            self._health[bind_key] = (False, time.monotonic())
+
+    @staticmethod
+    def check(engine):
+        """
+        Check that replica answers a query.
+
+        :param engine:
+        :return:
+        """
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return True
+        except SQLAlchemyError:
+            return False
+
+    def stats(self):
+        """
+        Get health of every replica.
+
+        :return: map of bind key to True, False or None if never checked
+        """
+        return {
+            bind_key: self._health.get(bind_key, (None, None))[0]
+            for bind_key in self.bind_keys
+        }
+
+
+replicas = ReplicaSet()
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending queries of read only requests to a replica.
+
+    Every read only request uses one replica for all its queries, flushes
+    and requests which are not read only use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        """
+        Return replica engine for read only requests, otherwise primary.
+
+        :param mapper:
+        :param clause:
+        :return:
+        """
+        if replicas.bind_keys and not self._flushing \
+                and has_app_context() and g.get('read_only'):
+            if 'replica_engine' not in g:
+                g.replica_engine = replicas.choose(
+                    lambda bind_key: db.get_engine(self.app, bind=bind_key)
+                )
+            if g.replica_engine is not None:
+                return g.replica_engine
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy using sessions routed between primary and replicas."""
+
+    def create_session(self, options):
+        """
+        Create factory of routing sessions.
+
+        :param options:
+        :return:
+        """
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+change_listeners = []
+
+
+def bump_data_version():
+    """
+    Increment version of the data shared by all workers after a write.
+
+    :return:
+    """
+    with db.engine.begin() as connection:
+        connection.execute(data_version_table.update().values(
+            value=data_version_table.c.value + 1,
+            updated_at=datetime.utcnow().replace(microsecond=0)
+        ))
+    if has_app_context():
+        g.pop('data_version', None)
+
+
+def get_data_version():
+    """
+    Get version of the data and date of the last write.
+
+    Read through the session, so requests reading from a replica get the
+    version replicated along with the data they read. Read once per app
+    context, or again after a write of this worker.
+
+    :return: version and timezone aware date of last write
+    """
+    if has_app_context() and 'data_version' in g:
+        return g.data_version
+
+    row = db.session.execute(select([
+        data_version_table.c.value, data_version_table.c.updated_at
+    ])).first()
+    if row is None:
+        data_version = 0, datetime.fromtimestamp(0, timezone.utc)
+    else:
+        data_version = \
+            row.value, row.updated_at.replace(tzinfo=timezone.utc)
+
+    if has_app_context():
+        g.data_version = data_version
+    return data_version
 
 
 def get_database_path(db_name=database_name, is_postgres_user=False):
@@ -29,33 +239,200 @@ def get_database_path(db_name=database_name, is_postgres_user=False):
         'postgres', 'postgres', 'localhost:5432', db_name)
 
 
+class TimedQueuePool(QueuePool):
+    """Queue pool recording how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        """
+        Init method of class.
+
+        :param args:
+        :param kwargs:
+        """
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        """
+        Get connection from queue and record wait time.
+
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
+def get_engine_options(db_url):
+    """
+    Get engine options of connection pool for given database url.
+
+    Pool size options do not apply to sqlite which does not use a queue
+    pool.
+
+    :param db_url:
+    :return:
+    """
+    options = {
+        'pool_pre_ping': SQLALCHEMY_POOL_PRE_PING,
+        'pool_recycle': SQLALCHEMY_POOL_RECYCLE,
+    }
+    if db_url and not db_url.startswith('sqlite'):
+        options.update({
+            'poolclass': TimedQueuePool,
+            'pool_size': SQLALCHEMY_POOL_SIZE,
+            'max_overflow': SQLALCHEMY_MAX_OVERFLOW,
+            'pool_timeout': SQLALCHEMY_POOL_TIMEOUT,
+        })
+
+    return options
+
+
+def get_pool_stats():
+    """
+    Get usage of the connection pool of the worker.
+
+    :return: dict with pool size, checked in/out and overflow connections
+    and time spent waiting for a connection
+    """
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__}
+
+    stats = {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'timeouts': pool.timeouts,
+            'wait_time': pool.wait_time,
+            'max_wait_time': pool.max_wait_time,
+        })
+
+    return stats
+
+
+def dispose_connections():
+    """
+    Drop pooled connections, to call in workers forked after app loaded.
+
+    Connections opened by the parent process must not be shared with the
+    forked workers. Without --preload the app is not loaded yet in the
+    parent process and there is nothing to drop.
+
+    :return:
+    """
+    if db.app is not None:
+        db.engine.dispose()
+
+
 def setup_db(app, is_test=False):
     """
     Bind a flask application and a SQLAlchemy service.
 
+    No connection is opened, tables are created by migrations.
+
     :param app:
-    :param is_test:
+    :param is_test: use the test database unless app config sets one
     :return:
     """
-    db_url = TEST_SQLALCHEMY_DATABASE_URI \
-        if is_test else SQLALCHEMY_DATABASE_URI
-    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = \
-        SQLALCHEMY_TRACK_MODIFICATIONS
+    db_url = app.config.setdefault(
+        "SQLALCHEMY_DATABASE_URI",
+        TEST_SQLALCHEMY_DATABASE_URI if is_test else SQLALCHEMY_DATABASE_URI
+    )
+    app.config.setdefault(
+        "SQLALCHEMY_TRACK_MODIFICATIONS", SQLALCHEMY_TRACK_MODIFICATIONS
+    )
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS", get_engine_options(db_url)
+    )
+    app.config.setdefault("SQLALCHEMY_BINDS", {
+        f'replica_{index}': replica_url
+        for index, replica_url in enumerate(SQLALCHEMY_REPLICA_URIS)
+    })
+    replicas.configure(app.config["SQLALCHEMY_BINDS"])
     db.app = app
     db.init_app(app)
-    db.create_all()
+
+
+def on_change(listener):
+    """
+    Register listener called after every committed write of a model.
+
+    Listener receives table name, action (insert, update or delete),
+    the written instance and, for updates, the previous values of changed
+    attributes. Bulk writes report the import action without instance.
+
+    :param listener:
+    :return: listener so that it can be used as decorator
+    """
+    change_listeners.append(listener)
+    return listener
+
+
+def notify_change(table, action, instance=None, changes=None):
+    """
+    Call registered listeners with given write.
+
+    :param table:
+    :param action:
+    :param instance:
+    :param changes: map of changed attribute to its previous value
+    :return:
+    """
+    bump_data_version()
+    for listener in change_listeners:
+        listener(table, action, instance, changes or {})
+
+
+def get_changes(instance):
+    """
+    Return previous values of attributes changed on instance.
+
+    Must be called before the session is flushed.
+
+    :param instance:
+    :return:
+    """
+    changes = {}
+    for attribute in inspect(instance).attrs:
+        deleted = attribute.history.deleted
+        if deleted:
+            changes[attribute.key] = deleted[0]
+
+    return changes
 
 
 class Question(db.Model):
     """Question."""
 
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', onupdate='CASCADE', ondelete='SET NULL'
+    ))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -80,15 +457,17 @@ class Question(db.Model):
         """
         db.session.add(self)
         db.session.commit()
+        notify_change(self.__tablename__, 'insert', self)
 
-    @staticmethod
-    def update():
+    def update(self):
         """
         Update method.
 
         :return:
         """
+        changes = get_changes(self)
         db.session.commit()
+        notify_change(self.__tablename__, 'update', self, changes)
 
     def delete(self):
         """
@@ -98,6 +477,7 @@ class Question(db.Model):
         """
         db.session.delete(self)
         db.session.commit()
+        notify_change(self.__tablename__, 'delete', self)
 
     def format(self):
         """
@@ -113,6 +493,31 @@ class Question(db.Model):
             'difficulty': self.difficulty
         }
 
+    @classmethod
+    def columns(cls):
+        """
+        Columns to select questions without building model instances.
+
+        :return:
+        """
+        return cls.id, cls.question, cls.answer, cls.category, cls.difficulty
+
+    @staticmethod
+    def format_row(row):
+        """
+        Format row selected with columns like format does for an object.
+
+        :param row:
+        :return:
+        """
+        return {
+            'id': row[0],
+            'question': row[1],
+            'answer': row[2],
+            'category': row[3],
+            'difficulty': row[4]
+        }
+
 
 class Category(db.Model):
     """Category."""
@@ -140,3 +545,29 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+quiz_session_table = Table(
+    'quiz_sessions', db.Model.metadata,
+    Column('id', String(32), primary_key=True),
+    Column('owner', String),
+    Column('remaining', Integer),
+    Column('expires_at', Float, index=True),
+)
+
+quiz_session_question_table = Table(
+    'quiz_session_questions', db.Model.metadata,
+    Column(
+        'session_id', String(32),
+        ForeignKey('quiz_sessions.id', ondelete='CASCADE'), primary_key=True
+    ),
+    Column('position', Integer, primary_key=True, autoincrement=False),
+    Column('question_id', Integer, nullable=False),
+)
+
+data_version_table = Table(
+    'data_version', db.Model.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('value', Integer, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+)
@@ -2,4 +2,49 @@ import os
 
 TEST_SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL')
 SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+SQLALCHEMY_REPLICA_URIS = [
+    url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+    if url
+]
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_POOL_SIZE = int(os.environ.get('SQLALCHEMY_POOL_SIZE', 5))
+SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW', 10))
+SQLALCHEMY_POOL_TIMEOUT = int(os.environ.get('SQLALCHEMY_POOL_TIMEOUT', 30))
+SQLALCHEMY_POOL_RECYCLE = int(
+    os.environ.get('SQLALCHEMY_POOL_RECYCLE', 30 * 60)
+)
+SQLALCHEMY_POOL_PRE_PING = \
+    os.environ.get('SQLALCHEMY_POOL_PRE_PING', 'true').lower() == 'true'
+QUESTIONS_COUNT_TTL = int(os.environ.get('QUESTIONS_COUNT_TTL', 60))
+APPROXIMATE_COUNT_THRESHOLD = int(
+    os.environ.get('APPROXIMATE_COUNT_THRESHOLD', 0)
+)
+CATEGORIES_CACHE_TTL = int(os.environ.get('CATEGORIES_CACHE_TTL', 300))
+QUESTION_INDEX_TTL = int(os.environ.get('QUESTION_INDEX_TTL', 300))
+QUIZ_SESSION_TTL = int(os.environ.get('QUIZ_SESSION_TTL', 30 * 60))
+SEARCH_INDEX_TTL = int(os.environ.get('SEARCH_INDEX_TTL', 300))
+ETAG_TTL = int(os.environ.get('ETAG_TTL', 60))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 30))
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+)
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+METRICS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+AUTH0_JWKS_URL = os.environ.get('AUTH0_JWKS_URL')
+REPLICA_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 10)
+)
+REPLICA_STICKY_TTL = int(os.environ.get('REPLICA_STICKY_TTL', 5))
+READ_RATE_LIMIT = float(os.environ.get('READ_RATE_LIMIT', 20))
+READ_RATE_BURST = int(os.environ.get('READ_RATE_BURST', 40))
+QUIZ_RATE_LIMIT = float(os.environ.get('QUIZ_RATE_LIMIT', 5))
+QUIZ_RATE_BURST = int(os.environ.get('QUIZ_RATE_BURST', 20))
+WRITE_RATE_LIMIT = float(os.environ.get('WRITE_RATE_LIMIT', 2))
+WRITE_RATE_BURST = int(os.environ.get('WRITE_RATE_BURST', 20))
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+MAX_IN_FLIGHT_REQUESTS = int(os.environ.get('MAX_IN_FLIGHT_REQUESTS', 12))
+MAX_REQUEST_QUEUE_TIME = float(os.environ.get('MAX_REQUEST_QUEUE_TIME', 10))
+OVERLOAD_RETRY_AFTER = int(os.environ.get('OVERLOAD_RETRY_AFTER', 1))
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_LEVEL = int(os.environ.get('BROTLI_LEVEL', 5))
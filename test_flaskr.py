@@ -1,19 +1,65 @@
 """Module for tests."""
 
+import gzip
+import io
 import json
+import time
 import unittest
 
-from flask_sqlalchemy import SQLAlchemy
+from flask import Response, g
 
-from flaskr import app
+from flaskr import create_app
+from flaskr.auth import JWKSKeyStore, TokenCache
+from flaskr.bulk import InvalidRow, iter_ndjson
+from flaskr.compression import compress
 from flaskr.constants import (
-    ERROR_MESSAGES, MISSING_AUTHORIZATION, MISSING_BEARER,
-    MISSING_BEARER_TOKEN, MISSING_TOKEN, STATUS_BAD_REQUEST,
-    STATUS_CREATED, STATUS_METHOD_NOT_ALLOWED, STATUS_NOT_FOUND,
-    STATUS_NO_CONTENT, STATUS_OK, STATUS_UNAUTHORIZED
+    BULK_IMPORT_MAX_ROW_SIZE, ERROR_MESSAGES, INVALID_JSON,
+    MISSING_AUTHORIZATION, MISSING_BEARER, MISSING_BEARER_TOKEN,
+    MISSING_TOKEN, QUIZ_MAX_BATCH_SIZE, REPLICA_STICKY_COOKIE,
+    ROW_TOO_LARGE, STATUS_BAD_REQUEST, STATUS_CREATED,
+    STATUS_METHOD_NOT_ALLOWED, STATUS_NOT_FOUND, STATUS_NOT_MODIFIED,
+    STATUS_NO_CONTENT, STATUS_OK, STATUS_TOO_MANY_REQUESTS,
+    STATUS_UNAUTHORIZED
 )
+from flaskr.http_cache import ResponseCache, response_cache
+from flaskr.instrumentation import count_queries
+from flaskr.limits import (
+    ConcurrencyLimiter, RateLimiter, get_client_key, quiz_limiter,
+    read_limiter, write_limiter
+)
+from flaskr.quiz import (
+    ALL_CATEGORIES, QuestionIndex, QuizSessionStore, build_alias_table,
+    get_difficulty_weight, question_index
+)
+from flaskr.replicas import mark_writer, read_only, reads_from_primary
+from flaskr.utils import (
+    categories_cache, get_all_categories, get_questions_count,
+    invalidate_categories
+)
+
+from migrations import apply_migrations
+
+from models import (
+    Category, Question, TimedQueuePool, bump_data_version, db,
+    dispose_connections, get_database_path, get_engine_options,
+    quiz_session_question_table, replicas
+)
+
+from settings import SQLALCHEMY_POOL_SIZE
+
+from sqlalchemy import create_engine, exc
 
-from models import get_database_path, setup_db
+app = create_app({'TESTING': True})
+
+
+def setUpModule():
+    """
+    Create tables of the test database once for all test cases.
+
+    :return:
+    """
+    with app.app_context():
+        apply_migrations()
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -27,7 +73,8 @@ class TriviaTestCase(unittest.TestCase):
         """
         self.app = app
         self.client = self.app.test_client
-        setup_db(self.app, is_test=True)
+        for limiter in (read_limiter, quiz_limiter, write_limiter):
+            limiter.clear()
 
         self.question = {
             "question": "Test 1",
@@ -64,13 +111,6 @@ class TriviaTestCase(unittest.TestCase):
             'Authorization': 'Bearer'
         }
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-
     def test_get_categories_success(self):
         """
         Success test case for get categories route.
@@ -83,6 +123,272 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(json_data.get('success'), True)
         self.assertTrue(len(json_data.get('categories')))
 
+    def test_get_categories_with_counts(self):
+        """
+        Get categories with number of questions of every category.
+
+        :return:
+        """
+        response = self.client().get('/categories?counts=true')
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        categories = json_data.get('categories')
+        self.assertTrue(len(categories))
+        for category_id, category in categories.items():
+            self.assertTrue(category.get('type'))
+            self.assertEqual(
+                category.get('total_questions'),
+                Question.query.filter_by(category=int(category_id)).count()
+            )
+
+    def test_get_categories_counts_updated_after_add_question(self):
+        """
+        Get categories with counts after a question was added.
+
+        :return:
+        """
+        category_id = str(self.question['category'])
+        response = self.client().get('/categories?counts=true')
+        total = response.get_json()['categories'][category_id][
+            'total_questions']
+        self.client().post(
+            '/questions', json=self.question, headers=self.manager_headers)
+
+        response = self.client().get('/categories?counts=true')
+        self.assertEqual(
+            response.get_json()['categories'][category_id]['total_questions'],
+            total + 1
+        )
+
+    def test_get_categories_not_modified(self):
+        """
+        Conditional get categories with etag of previous response.
+
+        :return:
+        """
+        response = self.client().get('/categories')
+        etag = response.headers.get('ETag')
+        self.assertTrue(etag)
+
+        response = self.client().get(
+            '/categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, STATUS_NOT_MODIFIED)
+        self.assertEqual(response.headers.get('ETag'), etag)
+        self.assertFalse(response.data)
+
+    def test_get_categories_modified_by_other_worker(self):
+        """
+        Conditional get categories after a write made by another worker.
+
+        :return:
+        """
+        response = self.client().get('/categories')
+        etag = response.headers.get('ETag')
+        with app.app_context():
+            bump_data_version()
+
+        response = self.client().get(
+            '/categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertNotEqual(response.headers.get('ETag'), etag)
+
+    def test_get_questions_not_cached_after_other_worker_write(self):
+        """
+        Cached responses are not served after a write of another worker.
+
+        :return:
+        """
+        response = self.client().get('/questions')
+        total_questions = response.get_json().get('total_questions')
+        with app.app_context():
+            question_id = db.session.execute(
+                Question.__table__.insert().values(
+                    question='Written by another worker?', answer='Yes',
+                    category=1, difficulty=1
+                )
+            ).inserted_primary_key[0]
+            db.session.commit()
+            bump_data_version()
+
+        try:
+            response = self.client().get('/questions')
+            self.assertEqual(
+                response.get_json().get('total_questions'),
+                total_questions + 1
+            )
+        finally:
+            with app.app_context():
+                db.session.execute(Question.__table__.delete().where(
+                    Question.id == question_id
+                ))
+                db.session.commit()
+                bump_data_version()
+
+    def test_questions_count_after_other_worker_write(self):
+        """
+        Cached counts are reloaded after a write of another worker.
+
+        :return:
+        """
+        with app.app_context():
+            total_questions = get_questions_count()
+            category_total = get_all_categories(with_counts=True)[1][
+                'total_questions'
+            ]
+            question_id = db.session.execute(
+                Question.__table__.insert().values(
+                    question='Written by another worker?', answer='Yes',
+                    category=1, difficulty=1
+                )
+            ).inserted_primary_key[0]
+            db.session.commit()
+            bump_data_version()
+
+        try:
+            with app.app_context():
+                self.assertEqual(get_questions_count(), total_questions + 1)
+                self.assertEqual(
+                    get_all_categories(with_counts=True)[1][
+                        'total_questions'
+                    ],
+                    category_total + 1
+                )
+        finally:
+            with app.app_context():
+                db.session.execute(Question.__table__.delete().where(
+                    Question.id == question_id
+                ))
+                db.session.commit()
+                bump_data_version()
+
+    def test_question_index_after_other_worker_write(self):
+        """
+        Questions created by another worker are picked without a rebuild.
+
+        :return:
+        """
+        with app.app_context():
+            question_index.get_ids(0)
+            loaded_at = question_index._loaded_at
+            question_id = db.session.execute(
+                Question.__table__.insert().values(
+                    question='Picked from another worker?', answer='Yes',
+                    category=1, difficulty=1
+                )
+            ).inserted_primary_key[0]
+            db.session.commit()
+            bump_data_version()
+
+        try:
+            with app.app_context():
+                self.assertIn(question_id, question_index.get_ids(1))
+                self.assertEqual(question_index._loaded_at, loaded_at)
+        finally:
+            with app.app_context():
+                db.session.execute(Question.__table__.delete().where(
+                    Question.id == question_id
+                ))
+                db.session.commit()
+                bump_data_version()
+            question_index.remove(question_id)
+
+    def test_get_categories_not_modified_skipped_for_writer(self):
+        """
+        Clients reading from primary after a write get the full response.
+
+        :return:
+        """
+        client = self.client()
+        response = client.get('/categories')
+        etag = response.headers.get('ETag')
+
+        client.set_cookie(
+            'localhost', REPLICA_STICKY_COOKIE, str(int(time.time()) + 1)
+        )
+        response = client.get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(response.headers.get('ETag'), etag)
+
+    def test_get_questions_modified_after_add_question(self):
+        """
+        Conditional get questions after a question was added.
+
+        :return:
+        """
+        response = self.client().get('/questions')
+        etag = response.headers.get('ETag')
+        self.client().post(
+            '/questions', json=self.question, headers=self.manager_headers)
+
+        response = self.client().get(
+            '/questions', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertNotEqual(response.headers.get('ETag'), etag)
+
+    def test_read_routes_within_query_budget(self):
+        """
+        Read routes do not issue more queries than their budget.
+
+        :return:
+        """
+        query_budgets = {
+            '/categories': 2,
+            '/questions': 4,
+            '/questions?page=2': 4,
+            '/categories/1/questions': 3,
+        }
+        response_cache.clear()
+        for url, budget in query_budgets.items():
+            with count_queries() as stats:
+                response = self.client().get(url)
+            self.assertEqual(response.status_code, STATUS_OK)
+            self.assertLessEqual(stats.count, budget, url)
+            self.assertIn('db;dur=', response.headers.get('Server-Timing'))
+
+    def test_get_metrics(self):
+        """
+        Success test case for metrics route.
+
+        :return:
+        """
+        self.client().get('/categories')
+        response = self.client().get('/metrics')
+        metrics = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertIn(
+            'flaskr_requests_total{method="GET",route="get_categories",'
+            'status="200"}',
+            metrics
+        )
+        self.assertIn(
+            'flaskr_request_duration_seconds_bucket{le="0.001",'
+            'method="GET",route="get_categories"}',
+            metrics
+        )
+        self.assertIn('flaskr_requests_in_flight{route="metrics"} 1.0',
+                      metrics)
+        for cache, stat in (('jwks', 'errors'), ('token', 'hits'),
+                            ('response', 'misses')):
+            self.assertIn(
+                f'flaskr_cache{{cache="{cache}",stat="{stat}"}}', metrics
+            )
+        self.assertNotIn('hit_ratio', metrics)
+
+    def test_get_categories_failed_too_many_requests(self):
+        """
+        Clients over the rate limit get 429 with Retry-After.
+
+        :return:
+        """
+        for _ in range(read_limiter.burst):
+            self.client().get('/categories')
+
+        response = self.client().get('/categories')
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_TOO_MANY_REQUESTS)
+        self.assertEqual(json_data.get('success'), False)
+        self.assertTrue(int(response.headers.get('Retry-After')) >= 1)
+
     def test_get_categories_failed(self):
         """
         Fail test case for get categories route.
@@ -111,6 +417,22 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(json_data.get('questions')))
         self.assertTrue(json_data.get('total_questions'))
 
+    def test_get_questions_compressed(self):
+        """
+        Questions are sent gzip compressed when client accepts it.
+
+        :return:
+        """
+        for _ in range(2):
+            response = self.client().get(
+                '/questions', headers={'Accept-Encoding': 'gzip'})
+            json_data = json.loads(gzip.decompress(response.data))
+            self.assertEqual(response.status_code, STATUS_OK)
+            self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+            self.assertIn('Accept-Encoding', response.headers.get('Vary'))
+            self.assertTrue(response.headers.get('ETag').startswith('W/'))
+            self.assertEqual(json_data.get('success'), True)
+
     def test_get_questions_failed(self):
         """
         Fail case for get questions.
@@ -125,6 +447,66 @@ class TriviaTestCase(unittest.TestCase):
             json_data.get('message'), ERROR_MESSAGES[STATUS_NOT_FOUND]
         )
 
+    def test_get_questions_by_cursor_success(self):
+        """
+        Success case for get questions paginated by keyset cursor.
+
+        :return:
+        """
+        response = self.client().get('/questions')
+        next_cursor = response.get_json().get('next_cursor')
+        self.assertTrue(next_cursor)
+
+        response = self.client().get(f'/questions?after_id={next_cursor}')
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('success'), True)
+        self.assertTrue(len(json_data.get('questions')))
+        self.assertGreater(
+            json_data.get('questions')[0].get('id'), next_cursor
+        )
+
+    def test_get_questions_total_after_add_question(self):
+        """
+        Success case for total questions being updated after adding question.
+
+        :return:
+        """
+        response = self.client().get('/questions')
+        total_questions = response.get_json().get('total_questions')
+        self.client().post(
+            '/questions', json=self.question, headers=self.manager_headers)
+
+        response = self.client().get('/questions')
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('total_questions'), total_questions + 1)
+
+    def test_export_questions_success(self):
+        """
+        Success case for exporting questions of category as csv.
+
+        :return:
+        """
+        response = self.client().get('/questions/export?format=csv&category=1')
+        lines = response.get_data(as_text=True).splitlines()
+        total_questions = self.client().get(
+            '/categories/1/questions').get_json().get('total_questions')
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(lines[0], 'id,question,answer,category,difficulty')
+        self.assertEqual(len(lines), total_questions + 1)
+
+    def test_export_questions_failed_bad_request(self):
+        """
+        Fail case for exporting questions with unknown format.
+
+        :return:
+        """
+        response = self.client().get('/questions/export?format=xml')
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
+        self.assertEqual(json_data.get('success'), False)
+
     def test_search_questions_success(self):
         """
         Success case of search questions api.
@@ -141,6 +523,52 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(json_data.get('questions')))
         self.assertTrue(json_data.get('total_questions'))
 
+    def test_search_questions_success_paginated(self):
+        """
+        Success case of search questions api with page and limit.
+
+        :return:
+        """
+        data = {
+            "searchTerm": "a",
+            "page": 2,
+            "limit": 2
+        }
+        response = self.client().post('/questions/filter', json=data)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('success'), True)
+        self.assertEqual(len(json_data.get('questions')), 2)
+        self.assertGreater(json_data.get('total_questions'), 4)
+
+    def test_search_questions_failed_bad_request(self):
+        """
+        Fail case of search questions api with invalid limit.
+
+        :return:
+        """
+        data = {
+            "searchTerm": "The",
+            "limit": 0
+        }
+        response = self.client().post('/questions/filter', json=data)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
+        self.assertEqual(json_data.get('success'), False)
+
+    def test_search_questions_failed_search_term_not_string(self):
+        """
+        Fail case of search questions api with search term not a string.
+
+        :return:
+        """
+        for search_term in (1, ['The'], {'term': 'The'}):
+            response = self.client().post(
+                '/questions/filter', json={"searchTerm": search_term})
+            json_data = response.get_json()
+            self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
+            self.assertEqual(json_data.get('success'), False)
+
     def test_search_questions_failed(self):
         """
         Success case of search questions api with method not allowed error.
@@ -169,6 +597,35 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(json_data.get('total_questions'))
         self.assertTrue(len(json_data.get('current_category')))
 
+    def test_get_questions_by_category_ordered_by_id(self):
+        """
+        Questions of category are integer categories ordered by id.
+
+        :return:
+        """
+        response = self.client().get('/categories/1/questions')
+        questions = response.get_json().get('questions')
+        ids = [question['id'] for question in questions]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual({question['category'] for question in questions}, {1})
+
+    def test_get_questions_by_category_after_add_question(self):
+        """
+        Cached questions of category are refreshed after adding question.
+
+        :return:
+        """
+        self.client().get('/categories/1/questions')
+        response = self.client().get('/categories/1/questions')
+        total_questions = response.get_json().get('total_questions')
+        self.client().post(
+            '/questions', json=self.question, headers=self.manager_headers)
+
+        response = self.client().get('/categories/1/questions')
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('total_questions'), total_questions + 1)
+
     def test_get_questions_by_category_failed_method_not_allowed(self):
         """
         Fail case for get questions by category with method not allowed error.
@@ -305,6 +762,52 @@ class TriviaTestCase(unittest.TestCase):
             json_data.get('message'), ERROR_MESSAGES[STATUS_UNAUTHORIZED]
         )
 
+    def test_import_questions_success(self):
+        """
+        Success case of import questions with one invalid row.
+
+        :return:
+        """
+        data = [self.question, {**self.question, "question": ""}]
+        response = self.client().post(
+            '/questions/import', json=data, headers=self.manager_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_CREATED)
+        self.assertEqual(json_data.get('success'), True)
+        self.assertEqual(json_data.get('imported'), 1)
+        self.assertEqual(json_data.get('failed'), 1)
+        self.assertEqual(json_data.get('errors')[0].get('row'), 1)
+
+    def test_import_questions_success_ndjson(self):
+        """
+        Success case of import questions sent as newline delimited json.
+
+        :return:
+        """
+        data = '\n'.join(
+            json.dumps(question)
+            for question in (self.question, self.updated_question)
+        )
+        response = self.client().post(
+            '/questions/import', data=data,
+            content_type='application/x-ndjson',
+            headers=self.manager_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_CREATED)
+        self.assertEqual(json_data.get('imported'), 2)
+
+    def test_import_questions_failed_unauthorized(self):
+        """
+        Fail case of import questions without permission on that api.
+
+        :return:
+        """
+        response = self.client().post(
+            '/questions/import', json=[], headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_UNAUTHORIZED)
+        self.assertEqual(json_data.get('success'), False)
+
     def test_update_question_success(self):
         """
         Success case of update question test case.
@@ -551,54 +1054,343 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(json_data.get('success'), True)
         self.assertTrue(len(json_data.get('question')))
 
-    def test_play_quiz_failed_method_not_allowed(self):
+    def test_play_quiz_success_all_previous_questions(self):
         """
-        Fail case for play quiz api with method not allowed error.
+        Success case for play quiz api when category has no questions left.
 
         :return:
         """
-        response = self.client().get('/quizzes', json={})
+        response = self.client().get('/categories/1/questions')
+        previous_questions = [
+            question.get('id')
+            for question in response.get_json().get('questions')
+        ]
+        data = {
+            "quiz_category": {
+                "id": 1
+            },
+            "previous_questions": previous_questions[1:]
+        }
+        response = self.client().post(
+            '/quizzes', json=data, headers=self.member_headers)
         json_data = response.get_json()
-        self.assertEqual(response.status_code, STATUS_METHOD_NOT_ALLOWED)
-        self.assertEqual(json_data.get('success'), False)
+        self.assertEqual(response.status_code, STATUS_OK)
         self.assertEqual(
-            json_data.get('message'), ERROR_MESSAGES[STATUS_METHOD_NOT_ALLOWED]
+            json_data.get('question').get('id'), previous_questions[0]
         )
 
-    def test_play_quiz_failed_bad_request(self):
+        data['previous_questions'] = previous_questions
+        response = self.client().post(
+            '/quizzes', json=data, headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('success'), True)
+        self.assertIsNone(json_data.get('question'))
+
+    def test_play_quiz_session_success(self):
         """
-        Fail case for play quiz api with method bad request.
+        Success case for play quiz api with server side session.
 
         :return:
         """
+        data = {
+            "quiz_category": {
+                "id": 1
+            },
+            "previous_questions": [],
+            "start_session": True
+        }
         response = self.client().post(
-            '/quizzes', json={}, headers=self.member_headers)
+            '/quizzes', json=data, headers=self.member_headers)
         json_data = response.get_json()
-        self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
-        self.assertEqual(json_data.get('success'), False)
+        session_id = json_data.get('session_id')
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertTrue(session_id)
+
+        question_ids = []
+        while json_data.get('question'):
+            question_ids.append(json_data.get('question').get('id'))
+            response = self.client().post(
+                '/quizzes', json={"session_id": session_id},
+                headers=self.member_headers)
+            json_data = response.get_json()
+            self.assertEqual(response.status_code, STATUS_OK)
+
+        response = self.client().get('/categories/1/questions')
         self.assertEqual(
-            json_data.get('message'), ERROR_MESSAGES[STATUS_BAD_REQUEST]
+            len(question_ids), response.get_json().get('total_questions')
         )
+        self.assertEqual(len(question_ids), len(set(question_ids)))
 
-    def test_play_quiz_failed_no_auth(self):
+    def test_quiz_sessions_shared_by_workers(self):
         """
-        Fail case of play quiz api test case without authorization.
+        Sessions started by a worker are served by others.
+
+        Stale copies of a session never pop a question twice.
 
         :return:
         """
-        response = self.client().post('/quizzes', json={})
-        json_data = response.get_json()
-        self.assertEqual(response.status_code, STATUS_UNAUTHORIZED)
-        self.assertEqual(json_data.get('success'), False)
-        self.assertEqual(json_data.get('message'), MISSING_AUTHORIZATION)
+        first_worker, second_worker = QuizSessionStore(), QuizSessionStore()
+        with app.app_context():
+            session = first_worker.create(ALL_CATEGORIES, owner='player')
+            self.assertIsNone(second_worker.get(session.id, 'other'))
+            shared = second_worker.get(session.id, 'player')
+            self.assertEqual(shared.remaining, session.remaining)
 
-    def test_play_quiz_failed_no_bearer_token(self):
+            question_ids = [
+                question['id']
+                for question in second_worker.next_questions(shared, 2)
+            ]
+            question_ids.append(first_worker.next_question(session)['id'])
+            self.assertEqual(len(question_ids), len(set(question_ids)))
+            self.assertEqual(
+                second_worker.get(session.id, 'player').remaining,
+                session.remaining
+            )
+
+            while first_worker.next_question(session):
+                pass
+            self.assertIsNone(second_worker.get(session.id, 'player'))
+
+    def test_quiz_session_pops_from_end_of_deck(self):
         """
-        Fail case of play quiz api test case with no bearer token.
+        Pops return the last remaining questions of the stored deck.
 
         :return:
         """
-        response = self.client().post(
+        store = QuizSessionStore()
+        with app.app_context():
+            session = store.create(1, owner='player')
+            with db.engine.connect() as connection:
+                deck = [
+                    row.question_id for row in connection.execute(
+                        quiz_session_question_table.select()
+                        .where(
+                            quiz_session_question_table.c.session_id
+                            == session.id
+                        )
+                        .order_by(quiz_session_question_table.c.position)
+                    )
+                ]
+
+            self.assertEqual(len(deck), session.remaining)
+            self.assertEqual(store._pop(session, 2), deck[:-3:-1])
+            self.assertEqual(
+                store.get(session.id, 'player').remaining, len(deck) - 2
+            )
+            self.assertEqual(
+                store._pop(session, len(deck)), deck[-3::-1]
+            )
+            self.assertEqual(store._pop(session, 1), [])
+            store._delete(session)
+
+    def test_play_quiz_session_failed_not_found(self):
+        """
+        Fail case for play quiz api with unknown session.
+
+        :return:
+        """
+        response = self.client().post(
+            '/quizzes', json={"session_id": "unknown"},
+            headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_NOT_FOUND)
+        self.assertEqual(json_data.get('success'), False)
+
+    def test_play_quiz_batch_success(self):
+        """
+        Success case for play quiz api returning several questions.
+
+        :return:
+        """
+        response = self.client().get('/categories/1/questions')
+        category_questions = response.get_json().get('questions')
+        data = {
+            "quiz_category": {
+                "id": 1
+            },
+            "previous_questions": [category_questions[0].get('id')],
+            "count": len(category_questions)
+        }
+        with count_queries() as stats:
+            response = self.client().post(
+                '/quizzes', json=data, headers=self.member_headers)
+        json_data = response.get_json()
+        question_ids = [
+            question.get('id') for question in json_data.get('questions')
+        ]
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('success'), True)
+        self.assertEqual(len(question_ids), len(category_questions) - 1)
+        self.assertEqual(len(question_ids), len(set(question_ids)))
+        self.assertNotIn(category_questions[0].get('id'), question_ids)
+        self.assertTrue(all(
+            question.get('category') == 1
+            for question in json_data.get('questions')
+        ))
+        self.assertLessEqual(stats.count, 2)
+
+    def test_play_quiz_batch_session_success(self):
+        """
+        Success case for play quiz api with session returning a batch.
+
+        :return:
+        """
+        data = {
+            "quiz_category": {
+                "id": 1
+            },
+            "previous_questions": [],
+            "start_session": True,
+            "count": 2
+        }
+        response = self.client().post(
+            '/quizzes', json=data, headers=self.member_headers)
+        json_data = response.get_json()
+        session_id = json_data.get('session_id')
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(len(json_data.get('questions')), 2)
+
+        response = self.client().post(
+            '/quizzes', json={"session_id": session_id, "count": 50},
+            headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        response = self.client().get('/categories/1/questions')
+        self.assertEqual(
+            len(json_data.get('questions')),
+            response.get_json().get('total_questions') - 2
+        )
+
+    def test_play_quiz_batch_failed_bad_request(self):
+        """
+        Fail case for play quiz api with count out of bounds.
+
+        :return:
+        """
+        for count in (0, QUIZ_MAX_BATCH_SIZE + 1, "2"):
+            data = {
+                "quiz_category": {
+                    "id": 1
+                },
+                "previous_questions": [],
+                "count": count
+            }
+            response = self.client().post(
+                '/quizzes', json=data, headers=self.member_headers)
+            self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
+
+    def test_play_quiz_target_difficulty_success(self):
+        """
+        Success case for play quiz api preferring a difficulty.
+
+        :return:
+        """
+        data = {
+            "quiz_category": {
+                "id": 1
+            },
+            "previous_questions": [],
+            "target_difficulty": 3
+        }
+        response = self.client().post(
+            '/quizzes', json=data, headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertEqual(json_data.get('success'), True)
+        self.assertEqual(json_data.get('question').get('category'), 1)
+
+        data['start_session'] = True
+        response = self.client().post(
+            '/quizzes', json=data, headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertTrue(json_data.get('session_id'))
+        self.assertTrue(json_data.get('question'))
+
+    def test_play_quiz_extreme_target_difficulty_success(self):
+        """
+        Success case for play quiz api with a target far from any question.
+
+        :return:
+        """
+        for data in (
+                {"target_difficulty": 5000, "count": 50},
+                {"target_difficulty": 5000, "start_session": True},
+                {"target_difficulty": -3000, "count": 5}):
+            data.update({"quiz_category": {"id": 1}, "previous_questions": []})
+            response = self.client().post(
+                '/quizzes', json=data, headers=self.member_headers)
+            self.assertEqual(response.status_code, STATUS_OK)
+            self.assertEqual(response.get_json().get('success'), True)
+
+    def test_play_quiz_target_difficulty_failed_bad_request(self):
+        """
+        Fail case for play quiz api with invalid target difficulty.
+
+        :return:
+        """
+        data = {
+            "quiz_category": {
+                "id": 1
+            },
+            "previous_questions": [],
+            "target_difficulty": "hard"
+        }
+        response = self.client().post(
+            '/quizzes', json=data, headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
+        self.assertEqual(json_data.get('success'), False)
+
+    def test_play_quiz_failed_method_not_allowed(self):
+        """
+        Fail case for play quiz api with method not allowed error.
+
+        :return:
+        """
+        response = self.client().get('/quizzes', json={})
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_METHOD_NOT_ALLOWED)
+        self.assertEqual(json_data.get('success'), False)
+        self.assertEqual(
+            json_data.get('message'), ERROR_MESSAGES[STATUS_METHOD_NOT_ALLOWED]
+        )
+
+    def test_play_quiz_failed_bad_request(self):
+        """
+        Fail case for play quiz api with method bad request.
+
+        :return:
+        """
+        response = self.client().post(
+            '/quizzes', json={}, headers=self.member_headers)
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_BAD_REQUEST)
+        self.assertEqual(json_data.get('success'), False)
+        self.assertEqual(
+            json_data.get('message'), ERROR_MESSAGES[STATUS_BAD_REQUEST]
+        )
+
+    def test_play_quiz_failed_no_auth(self):
+        """
+        Fail case of play quiz api test case without authorization.
+
+        :return:
+        """
+        response = self.client().post('/quizzes', json={})
+        json_data = response.get_json()
+        self.assertEqual(response.status_code, STATUS_UNAUTHORIZED)
+        self.assertEqual(json_data.get('success'), False)
+        self.assertEqual(json_data.get('message'), MISSING_AUTHORIZATION)
+
+    def test_play_quiz_failed_no_bearer_token(self):
+        """
+        Fail case of play quiz api test case with no bearer token.
+
+        :return:
+        """
+        response = self.client().post(
             '/quizzes', json={}, headers=self.no_bearer_token)
         json_data = response.get_json()
         self.assertEqual(response.status_code, STATUS_UNAUTHORIZED)
@@ -640,6 +1432,734 @@ class TriviaTestCase(unittest.TestCase):
         pass
 
 
+class StaticJWKSKeyStore(JWKSKeyStore):
+    """Key store serving a fixed key set instead of calling Auth0."""
+
+    def __init__(self, jwks, **kwargs):
+        """
+        Init method of class.
+
+        :param jwks: key set returned on every fetch
+        :param kwargs:
+        """
+        super().__init__('', **kwargs)
+        self.jwks = jwks
+        self.fetches = 0
+
+    def _fetch(self):
+        """
+        Return the static key set and count the fetch.
+
+        :return:
+        """
+        self.fetches += 1
+        return self.jwks, 'public, max-age=600'
+
+
+class FailingJWKSKeyStore(StaticJWKSKeyStore):
+    """Key store whose fetches fail once the key set is loaded."""
+
+    def _fetch(self):
+        """
+        Return the static key set on first fetch, then fail.
+
+        :return:
+        """
+        if self.fetches:
+            self.fetches += 1
+            raise OSError('Auth0 is unreachable')
+
+        return super()._fetch()
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the jwks key store test case."""
+
+    def setUp(self):
+        """
+        Define key set used by the key store.
+
+        :return:
+        """
+        self.jwks = {
+            'keys': [{
+                'kty': 'RSA', 'kid': 'key-1', 'use': 'sig', 'n': 'n', 'e': 'e'
+            }]
+        }
+
+    def test_get_key_cached(self):
+        """
+        Keys are fetched once and then served from memory.
+
+        :return:
+        """
+        store = StaticJWKSKeyStore(self.jwks)
+        self.assertEqual(store.get_key('key-1').get('kid'), 'key-1')
+        self.assertEqual(store.get_key('key-1').get('kid'), 'key-1')
+        self.assertEqual(store.fetches, 1)
+        self.assertEqual(store.stats().get('hits'), 2)
+        self.assertGreater(store.stats().get('expires_in'), 500)
+
+    def test_get_key_unknown_kid_rate_limited(self):
+        """
+        Unknown kid triggers at most one refetch per interval.
+
+        :return:
+        """
+        store = StaticJWKSKeyStore(self.jwks, min_refetch_interval=60)
+        store.get_key('key-1')
+        self.assertIsNone(store.get_key('key-2'))
+        self.assertIsNone(store.get_key('key-2'))
+        self.assertEqual(store.fetches, 1)
+        self.assertEqual(store.stats().get('misses'), 2)
+
+        store = StaticJWKSKeyStore(self.jwks, min_refetch_interval=0)
+        store.get_key('key-1')
+        self.assertIsNone(store.get_key('key-2'))
+        self.assertEqual(store.fetches, 2)
+        self.assertEqual(store.stats().get('forced_refreshes'), 1)
+
+    def test_get_key_failed_fetch_backs_off(self):
+        """
+        Failed fetch serves stale keys until retry, unknown kids included.
+
+        :return:
+        """
+        store = FailingJWKSKeyStore(
+            self.jwks, min_refetch_interval=60, retry_interval=30
+        )
+        store.get_key('key-1')
+        store.clear()
+        store._keys = {'key-1': store.jwks['keys'][0]}
+        for _ in range(5):
+            self.assertEqual(store.get_key('key-1').get('kid'), 'key-1')
+            self.assertIsNone(store.get_key('key-2'))
+        self.assertEqual(store.fetches, 2)
+        self.assertEqual(store.stats().get('errors'), 1)
+        self.assertGreater(store.stats().get('expires_in'), 20)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case."""
+
+    def setUp(self):
+        """
+        Define payloads used by the token cache.
+
+        :return:
+        """
+        self.payload = {
+            'sub': 'auth0|member',
+            'exp': time.time() + 3600,
+            'permissions': ['play-quiz']
+        }
+        self.expired_payload = {**self.payload, 'exp': time.time() - 1}
+
+    def test_get_cached_payload(self):
+        """
+        Cached payload is returned until token expires.
+
+        :return:
+        """
+        cache = TokenCache()
+        cache.set('token', self.payload)
+        cache.set('expired', self.expired_payload)
+        self.assertEqual(cache.get('token'), self.payload)
+        self.assertIsNone(cache.get('expired'))
+        self.assertIsNone(cache.get('unknown'))
+        self.assertEqual(cache.stats().get('size'), 1)
+        self.assertEqual(cache.stats().get('hit_ratio'), 1 / 3)
+
+    def test_revoked_token_not_served(self):
+        """
+        Revoked token is never returned nor cached again.
+
+        :return:
+        """
+        cache = TokenCache()
+        cache.set('token', self.payload)
+        cache.revoke('token')
+        self.assertTrue(cache.is_revoked('token'))
+        cache.set('token', self.payload)
+        self.assertIsNone(cache.get('token'))
+
+    def test_evict_least_recently_used(self):
+        """
+        Cache size is bounded by evicting least recently used tokens.
+
+        :return:
+        """
+        cache = TokenCache(max_size=2)
+        cache.set('first', self.payload)
+        cache.set('second', self.payload)
+        cache.get('first')
+        cache.set('third', self.payload)
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('first'))
+        self.assertEqual(cache.stats().get('evictions'), 1)
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """This class represents the read replica routing test case."""
+
+    def setUp(self):
+        """
+        Use database of the app as stand-in replica.
+
+        :return:
+        """
+        self.binds = app.config['SQLALCHEMY_BINDS']
+        self.replica_url = app.config['SQLALCHEMY_DATABASE_URI']
+
+    def configure(self, **binds):
+        """
+        Set replica binds of the app.
+
+        :param binds:
+        :return:
+        """
+        app.config['SQLALCHEMY_BINDS'] = binds
+        replicas.configure(binds)
+
+    def get_bind(self, read_only, headers=None):
+        """
+        Return engine used by session of a request.
+
+        :param read_only:
+        :param headers:
+        :return:
+        """
+        with app.test_request_context(headers=headers):
+            g.read_only = read_only and not reads_from_primary()
+            return db.session.get_bind()
+
+    def test_read_only_request_uses_replica(self):
+        """
+        Read only requests use the replica, other requests the primary.
+
+        :return:
+        """
+        self.configure(replica_0=self.replica_url)
+        with app.app_context():
+            replica = db.get_engine(app, bind='replica_0')
+            primary = db.engine
+        self.assertIs(self.get_bind(read_only=True), replica)
+        self.assertIs(self.get_bind(read_only=False), primary)
+
+    def test_unhealthy_replica_skipped(self):
+        """
+        Replicas failing health check are skipped.
+
+        :return:
+        """
+        self.configure(
+            replica_0='sqlite:////nonexistent/replica.db',
+            replica_1=self.replica_url
+        )
+        with app.app_context():
+            replica = db.get_engine(app, bind='replica_1')
+        self.assertIs(self.get_bind(read_only=True), replica)
+        self.assertIs(self.get_bind(read_only=True), replica)
+        self.assertEqual(
+            replicas.stats(), {'replica_0': False, 'replica_1': True}
+        )
+
+    def test_writer_reads_from_primary(self):
+        """
+        Clients which wrote recently read from primary.
+
+        :return:
+        """
+        self.configure(replica_0=self.replica_url)
+        with app.app_context():
+            primary = db.engine
+        sticky_cookie = f'{REPLICA_STICKY_COOKIE}={int(time.time()) + 2}'
+        self.assertIs(
+            self.get_bind(read_only=True, headers={'Cookie': sticky_cookie}),
+            primary
+        )
+
+        forged_cookie = f'{REPLICA_STICKY_COOKIE}={int(time.time()) + 3600}'
+        self.assertIsNot(
+            self.get_bind(read_only=True, headers={'Cookie': forged_cookie}),
+            primary
+        )
+
+    def test_read_routes_set_no_sticky_cookie(self):
+        """
+        Read only POST routes do not make the client read from primary.
+
+        :return:
+        """
+        self.configure(replica_0=self.replica_url)
+        with open('./tokens.json') as json_file:
+            member_headers = {
+                'Authorization': 'Bearer {}'.format(
+                    json.load(json_file).get('member'))
+            }
+
+        client = app.test_client()
+        response = client.post('/questions/filter', json={'searchTerm': 'a'})
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertNotIn('Set-Cookie', response.headers)
+
+        response = client.post('/quizzes', json={
+            'quiz_category': {'id': 1}, 'previous_questions': []
+        }, headers=member_headers)
+        self.assertEqual(response.status_code, STATUS_OK)
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def test_writes_set_sticky_cookie(self):
+        """
+        Successful writes make the client read from primary.
+
+        :return:
+        """
+        self.configure(replica_0=self.replica_url)
+        with app.test_request_context('/questions', method='POST'):
+            response = mark_writer(Response())
+        self.assertIn(REPLICA_STICKY_COOKIE, response.headers['Set-Cookie'])
+
+        with app.test_request_context('/quizzes', method='POST'):
+            response = mark_writer(read_only(Response)())
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def tearDown(self):
+        """
+        Restore replica binds of the app.
+
+        :return:
+        """
+        self.configure(**self.binds)
+
+
+class BulkImportTestCase(unittest.TestCase):
+    """This class represents the bulk import parsing test case."""
+
+    def test_iter_ndjson_skips_oversized_lines(self):
+        """
+        Lines over the row size limit are reported and skipped.
+
+        :return:
+        """
+        stream = io.BytesIO(
+            b'{"answer": "first"}\n'
+            + b'"' + b'a' * BULK_IMPORT_MAX_ROW_SIZE * 2 + b'"\n'
+            + b'not json\n'
+            + b'{"answer": "last"}'
+        )
+        rows = list(iter_ndjson(stream))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0], {'answer': 'first'})
+        self.assertIsInstance(rows[1], InvalidRow)
+        self.assertEqual(
+            rows[1].message, ROW_TOO_LARGE.format(BULK_IMPORT_MAX_ROW_SIZE)
+        )
+        self.assertEqual(rows[2].message, INVALID_JSON)
+        self.assertEqual(rows[3], {'answer': 'last'})
+
+
+class CategoriesCacheTestCase(unittest.TestCase):
+    """This class represents the categories cache test case."""
+
+    def setUp(self):
+        """
+        Add a category without notifying the cache.
+
+        :return:
+        """
+        with app.app_context():
+            self.category_id = db.session.execute(
+                Category.__table__.insert().values(type='Uncached')
+            ).inserted_primary_key[0]
+            db.session.commit()
+
+    def test_routes_skip_category_query_after_warm_up(self):
+        """
+        Category routes do not query categories once they are cached.
+
+        :return:
+        """
+        for url in ('/categories', '/categories/1/questions'):
+            app.test_client().get(url)
+            response_cache.clear()
+            with count_queries() as warm_stats:
+                response = app.test_client().get(url)
+            self.assertEqual(response.status_code, STATUS_OK)
+
+            invalidate_categories()
+            response_cache.clear()
+            with count_queries() as cold_stats:
+                app.test_client().get(url)
+            self.assertEqual(cold_stats.count, warm_stats.count + 1, url)
+
+    def test_invalidate_categories_reloads(self):
+        """
+        Categories are loaded again after invalidation.
+
+        :return:
+        """
+        with app.app_context():
+            invalidate_categories()
+            self.assertIn(self.category_id, get_all_categories())
+            self.remove_category()
+            self.assertIn(self.category_id, get_all_categories())
+
+            invalidate_categories()
+            self.assertNotIn(self.category_id, get_all_categories())
+
+    def test_categories_reloaded_after_ttl(self):
+        """
+        Categories are loaded again once their ttl expired.
+
+        :return:
+        """
+        self.addCleanup(setattr, categories_cache, 'ttl', categories_cache.ttl)
+        categories_cache.ttl = 0.05
+        with app.app_context():
+            invalidate_categories()
+            self.assertIn(self.category_id, get_all_categories())
+            self.remove_category()
+            with count_queries() as stats:
+                self.assertIn(self.category_id, get_all_categories())
+            self.assertEqual(stats.count, 0)
+
+            time.sleep(0.06)
+            self.assertNotIn(self.category_id, get_all_categories())
+
+    def remove_category(self):
+        """
+        Delete the added category without notifying the cache.
+
+        :return:
+        """
+        with app.app_context():
+            db.session.execute(Category.__table__.delete().where(
+                Category.id == self.category_id
+            ))
+            db.session.commit()
+
+    def tearDown(self):
+        """
+        Delete the added category and drop cached categories.
+
+        :return:
+        """
+        self.remove_category()
+        invalidate_categories()
+        response_cache.clear()
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """This class represents the response cache test case."""
+
+    def test_variant_encoded_once(self):
+        """
+        Encoded variant of a body is kept and counted in the cache size.
+
+        :return:
+        """
+        encoded = []
+
+        def encode(body, encoding):
+            """
+            Record call and return start of body.
+
+            :param body:
+            :param encoding:
+            :return:
+            """
+            encoded.append(encoding)
+            return body[:2]
+
+        cache = ResponseCache(ttl=60, max_bytes=1024)
+        cache.set(('route',), b'body', 'application/json', ['tag'])
+        self.assertEqual(cache.get_variant(('route',), 'gzip', encode), b'bo')
+        self.assertEqual(cache.get_variant(('route',), 'gzip', encode), b'bo')
+        self.assertEqual(encoded, ['gzip'])
+        self.assertEqual(cache.stats().get('size'), 6)
+
+        cache.invalidate('tag')
+        self.assertIsNone(cache.get_variant(('route',), 'gzip', encode))
+        self.assertEqual(cache.stats().get('size'), 0)
+
+
+class CompressionTestCase(unittest.TestCase):
+    """This class represents the response compression test case."""
+
+    def test_gzip_compress_is_stable(self):
+        """
+        Gzip body decompresses to original and does not depend on time.
+
+        :return:
+        """
+        body = json.dumps({'questions': ['question'] * 200}).encode()
+        compressed = compress(body, 'gzip')
+        self.assertEqual(gzip.decompress(compressed), body)
+        self.assertLess(len(compressed), len(body))
+        time.sleep(1)
+        self.assertEqual(compress(body, 'gzip'), compressed)
+
+
+class LimitsTestCase(unittest.TestCase):
+    """This class represents the rate and concurrency limits test case."""
+
+    def test_rate_limiter_allows_burst_then_refills(self):
+        """
+        Bucket allows burst at once then refills at rate.
+
+        :return:
+        """
+        limiter = RateLimiter(rate=100, burst=2)
+        self.assertEqual(limiter.acquire('client'), 0)
+        self.assertEqual(limiter.acquire('client'), 0)
+        self.assertGreater(limiter.acquire('client'), 0)
+        self.assertEqual(limiter.acquire('other'), 0)
+        time.sleep(0.02)
+        self.assertEqual(limiter.acquire('client'), 0)
+
+    def test_rate_limiter_disabled(self):
+        """
+        Rate of 0 disables the limit.
+
+        :return:
+        """
+        limiter = RateLimiter(rate=0, burst=1)
+        for _ in range(10):
+            self.assertEqual(limiter.acquire('client'), 0)
+
+    def test_concurrency_limiter(self):
+        """
+        Requests over the maximum in flight are not admitted.
+
+        :return:
+        """
+        limiter = ConcurrencyLimiter(max_in_flight=1)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+
+    def test_client_key_behind_trusted_proxy(self):
+        """
+        Clients behind trusted proxies are keyed on their forwarded address.
+
+        :return:
+        """
+        headers = {'X-Forwarded-For': '203.0.113.7, 10.0.0.2'}
+        for count, key in ((0, 'ip:127.0.0.1'), (1, 'ip:10.0.0.2'),
+                           (2, 'ip:203.0.113.7')):
+            proxied_app = create_app({
+                'TESTING': True, 'TRUSTED_PROXY_COUNT': count
+            })
+            proxied_app.add_url_rule('/client-key', view_func=get_client_key)
+            response = proxied_app.test_client().get(
+                '/client-key', headers=headers
+            )
+            self.assertEqual(response.get_data(as_text=True), key)
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    """This class represents the database connection pool test case."""
+
+    def test_get_engine_options(self):
+        """
+        Queue pool options are only set for databases other than sqlite.
+
+        :return:
+        """
+        options = get_engine_options('postgres://localhost/trivia')
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], SQLALCHEMY_POOL_SIZE)
+        self.assertIn('pool_recycle', options)
+
+        options = get_engine_options('sqlite:///trivia.db')
+        self.assertNotIn('poolclass', options)
+        self.assertNotIn('pool_size', options)
+        self.assertIn('pool_pre_ping', options)
+
+    def test_timed_queue_pool(self):
+        """
+        Pool counts checkouts, timeouts and time spent waiting.
+
+        :return:
+        """
+        engine = create_engine(
+            'sqlite://', poolclass=TimedQueuePool, pool_size=1,
+            max_overflow=0, pool_timeout=0.05
+        )
+        connection = engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+        connection.close()
+
+        pool = engine.pool
+        self.assertEqual(pool.checkouts, 2)
+        self.assertEqual(pool.timeouts, 1)
+        self.assertGreaterEqual(pool.max_wait_time, 0.05)
+        self.assertGreaterEqual(pool.wait_time, pool.max_wait_time)
+
+    def test_dispose_connections(self):
+        """
+        Pool of the app is replaced so that no connection is reused.
+
+        :return:
+        """
+        with app.app_context():
+            pool = db.engine.pool
+            dispose_connections()
+            self.assertIsNot(db.engine.pool, pool)
+
+    def test_pool_metrics(self):
+        """
+        Metrics export usage of the connection pool.
+
+        :return:
+        """
+        self.addCleanup(setattr, db, 'app', db.app)
+        pooled_app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_ENGINE_OPTIONS': {'poolclass': TimedQueuePool}
+        })
+        client = pooled_app.test_client()
+        client.get('/categories')
+        metrics = client.get('/metrics').get_data(as_text=True)
+        self.assertIn('flaskr_db_pool{stat="checked_out"}', metrics)
+        self.assertIn('flaskr_db_pool{stat="checkouts"}', metrics)
+        self.assertIn('flaskr_db_pool_max_wait_seconds', metrics)
+
+
+class QuestionIndexTestCase(unittest.TestCase):
+    """This class represents the quiz question index test case."""
+
+    def setUp(self):
+        """
+        Define index with questions of difficulty 1 to 3 in category 1.
+
+        :return:
+        """
+        self.index = QuestionIndex()
+        self.index._buckets = {ALL_CATEGORIES: ([], {})}
+        for question_id, difficulty in enumerate((1, 1, 2, 3, 3, 3), 1):
+            self.index.add(question_id, 1, difficulty)
+
+    def test_stale_index_used_while_reloading(self):
+        """
+        Picks use the current index while another thread reloads it.
+
+        :return:
+        """
+        self.index.invalidate()
+        with self.index._load_lock:
+            self.assertEqual(self.index.get_ids(1), [1, 2, 3, 4, 5, 6])
+            self.assertIsNotNone(self.index.choose(1))
+
+    def test_alias_table_matches_weights(self):
+        """
+        Probability of every index in alias table is proportional to weight.
+
+        :return:
+        """
+        weights = [1, 2, 3, 4]
+        probabilities, aliases = build_alias_table(weights)
+        drawn = [0.0] * len(weights)
+        for index, probability in enumerate(probabilities):
+            drawn[index] += probability / len(weights)
+            drawn[aliases[index]] += (1 - probability) / len(weights)
+
+        for weight, probability in zip(weights, drawn):
+            self.assertAlmostEqual(probability, weight / sum(weights))
+
+    def test_choose_weighted_prefers_target_difficulty(self):
+        """
+        Questions of target difficulty are picked more often.
+
+        :return:
+        """
+        picks = [
+            self.index.choose(1, target_difficulty=1) for _ in range(2000)
+        ]
+        easy = sum(1 for question_id in picks if question_id in (1, 2))
+        hard = sum(1 for question_id in picks if question_id in (4, 5, 6))
+        self.assertGreater(easy, hard)
+
+    def test_choose_weighted_skips_excluded(self):
+        """
+        Weighted picks never return excluded or removed questions.
+
+        :return:
+        """
+        self.index.remove(6)
+        self.assertIsNone(
+            self.index.choose(1, {1, 2, 3, 4, 5}, target_difficulty=3)
+        )
+        self.assertEqual(
+            self.index.choose(1, {1, 2, 3, 5}, target_difficulty=1), 4
+        )
+        self.assertEqual(
+            self.index.choose(ALL_CATEGORIES, {2, 3, 4, 5},
+                              target_difficulty=9),
+            1
+        )
+
+    def test_sample_returns_distinct_allowed_ids(self):
+        """
+        Sampled ids are distinct and never excluded, with or without weight.
+
+        :return:
+        """
+        for target_difficulty in (None, 2):
+            self.assertEqual(
+                sorted(self.index.sample(1, 1, {1, 2, 3, 4, 5},
+                                         target_difficulty)),
+                [6]
+            )
+            sampled = self.index.sample(1, 10, {1}, target_difficulty)
+            self.assertEqual(sorted(sampled), [2, 3, 4, 5, 6])
+            sampled = self.index.sample(ALL_CATEGORIES, 2, (),
+                                        target_difficulty)
+            self.assertEqual(len(set(sampled)), 2)
+
+    def test_extreme_target_difficulty(self):
+        """
+        Targets far from every difficulty pick the closest questions.
+
+        :return:
+        """
+        for target_difficulty, closest in ((5000, {4, 5, 6}), (-3000, {1, 2})):
+            weighted_ids = self.index.get_weighted_ids(1, target_difficulty)
+            self.assertTrue(all(weight > 0 for _, weight in weighted_ids))
+            self.assertEqual(
+                {
+                    question_id for question_id, weight in weighted_ids
+                    if weight == 1
+                },
+                closest
+            )
+            self.assertEqual(
+                len(self.index.sample(1, 10, (), target_difficulty)), 6
+            )
+            self.assertEqual(
+                self.index.choose(1, {1, 2, 3, 4, 5}, target_difficulty), 6
+            )
+
+    def test_weighted_ids_follow_moved_questions(self):
+        """
+        Weights of questions follow difficulty and category updates.
+
+        :return:
+        """
+        self.index.add(3, 2, 1)
+        self.assertEqual(
+            self.index.get_weighted_ids(2, 3),
+            [(3, get_difficulty_weight(1, 1))]
+        )
+        self.assertNotIn(
+            3, [question_id for question_id, _ in
+                self.index.get_weighted_ids(1, 3)]
+        )
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,5 @@
+"""Module creating the app served by gunicorn."""
+
+from flaskr import create_app
+
+app = create_app()